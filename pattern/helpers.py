@@ -43,3 +43,159 @@ def encode_string(v, encoding="utf-8"):
 
 decode_utf8 = decode_string
 encode_utf8 = encode_string
+
+#--- CACHE -----------------------------------------------------------------------------------------
+# A bounded cache discards the least recently used (LRU) items when it is full.
+# Optionally, items expire after a given number of seconds (time-to-live, TTL).
+# Hit and miss counts are tracked so the cache can be tuned (e.g., Spelling.suggest_many()).
+# Optionally, the cache holds at most a given number of bytes (estimated with sys.getsizeof()).
+
+import sys
+import threading
+
+from time import time
+from collections import OrderedDict
+
+
+class LRUCache(object):
+
+    def __init__(self, size=1000, ttl=None, memory=None):
+        """ A dictionary that holds at most the given number of items,
+            discarding the least recently used item when a new item is added.
+            With ttl (seconds), items older than the given time are discarded.
+            With memory (bytes), items are discarded when their estimated size exceeds it.
+        """
+        self.size = size
+        self.ttl = ttl
+        self.memory = memory
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.nbytes = 0            # Estimated size of the cached items.
+        self._data = OrderedDict() # {key: (time, value)}
+        self._lock = threading.RLock()
+
+    def _sizeof(self, k, v):
+        # Key + (time, value)-tuple + time + value + OrderedDict entry.
+        return sys.getsizeof(k) + sys.getsizeof(v) + 200
+
+    def get(self, k, default=None):
+        """ Returns the cached value for the given key (or default), updating hit/miss counts.
+        """
+        with self._lock:
+            try:
+                t, v = self._data[k]
+            except KeyError:
+                self.misses += 1
+                return default
+            if self.ttl is not None and time() - t > self.ttl:
+                self.pop(k)
+                self.misses += 1
+                return default
+            self._data.move_to_end(k)
+            self.hits += 1
+            return v
+
+    def set(self, k, v):
+        with self._lock:
+            self.pop(k)
+            self._data[k] = (time(), v)
+            self.nbytes += self._sizeof(k, v)
+            while len(self._data) > max(self.size, 0) or \
+                  len(self._data) > 0 and self.memory is not None and self.nbytes > self.memory:
+                k, (t, v) = self._data.popitem(last=False)
+                self.nbytes -= self._sizeof(k, v)
+                self.evictions += 1
+
+    __setitem__ = set
+
+    def __contains__(self, k):
+        with self._lock:
+            return k in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+    def pop(self, k, default=None):
+        with self._lock:
+            if k not in self._data:
+                return default
+            v = self._data.pop(k)[1]
+            self.nbytes -= self._sizeof(k, v)
+            return v
+
+    def keys(self):
+        with self._lock:
+            return list(self._data.keys())
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+            self.nbytes = 0
+
+    def __getstate__(self):
+        # Locks can't be pickled (e.g., Model.save()).
+        with self._lock:
+            return dict((k, v) for k, v in self.__dict__.items() if k != "_lock")
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.RLock()
+
+    @property
+    def hit_rate(self):
+        """ Yields the ratio of cache hits to lookups (0.0-1.0).
+        """
+        return self.hits / float(self.hits + self.misses or 1)
+
+    @property
+    def stats(self):
+        """ Yields a dictionary with the number of items, hits, misses, evictions and bytes.
+        """
+        return {
+                "items": len(self._data),
+                 "hits": self.hits,
+               "misses": self.misses,
+            "evictions": self.evictions,
+                "bytes": self.nbytes
+        }
+
+
+def percentiles(values, p=(50, 90, 99)):
+    """ Returns a dictionary of (percentile, value)-items for the given list of values,
+        using the nearest-rank method, e.g., {50: 0.001, 90: 0.004, 99: 0.010}.
+    """
+    values = sorted(values)
+    if not values:
+        return dict((x, 0.0) for x in p)
+    return dict((x, values[min(len(values) - 1, int(len(values) * x / 100.0))]) for x in p)
+
+#--- PROCESS POOL ----------------------------------------------------------------------------------
+# A pool of worker processes that share the same (read-only) state, e.g., a Parser.
+# The state is passed to each worker process once when it starts (not with each task),
+# which works whether processes are forked or spawned (the default on macOS, Windows).
+# Task functions must be defined at module level and retrieve the state with worker_state().
+
+_state = None
+
+
+def _initialize(state):
+    global _state
+    _state = state
+
+
+def process_pool(processes=2, state=None):
+    """ Returns a multiprocessing.Pool of the given number of worker processes,
+        in which worker_state() returns the given state.
+    """
+    from multiprocessing import Pool
+    return Pool(processes=processes, initializer=_initialize, initargs=(state,))
+
+
+def worker_state():
+    """ Returns the state given to process_pool(), in a worker process.
+    """
+    return _state
@@ -19,10 +19,15 @@ import os
 import sys
 import re
 import string
+import stat
 import types
+import mmap
+import glob
+import weakref
 import json
 import codecs
 import operator
+import tempfile
 
 from io import open
 
@@ -31,9 +36,12 @@ from codecs import BOM_UTF8
 BOM_UTF8 = BOM_UTF8.decode('utf-8')
 
 from xml.etree import cElementTree
-from itertools import chain
-from collections import defaultdict
-from math import log, sqrt
+from itertools import chain, islice
+from collections import defaultdict, deque, Counter
+from hashlib import md5
+from math import log, exp, sqrt
+from random import Random
+from time import time
 
 try:
     MODULE = os.path.dirname(os.path.realpath(__file__))
@@ -46,6 +54,7 @@ from pattern.text.tree import SLASH, WORD, POS, CHUNK, PNP, REL, ANCHOR, LEMMA,
 DEFAULT = "default"
 
 from pattern.helpers import encode_string, decode_string
+from pattern.helpers import LRUCache, percentiles, process_pool, worker_state
 
 decode_utf8 = decode_string
 encode_utf8 = encode_string
@@ -59,28 +68,74 @@ def ngrams(string, n=3, punctuation=PUNCTUATION, continuous=False):
         With continuous=False, n-grams will not run over sentence markers (i.e., .!?).
         Punctuation marks are stripped from words.
     """
+    return list(iter_ngrams(string, n, punctuation, continuous))
 
-    def strip_punctuation(s, punctuation=set(punctuation)):
-        return [w for w in s if (isinstance(w, Word) and w.string or w) not in punctuation]
 
-    if n <= 0:
-        return []
-    if isinstance(string, list):
-        s = [strip_punctuation(string)]
-    if isinstance(string, str):
-        s = [strip_punctuation(s.split(" ")) for s in tokenize(string)]
-    if isinstance(string, Sentence):
-        s = [strip_punctuation(string)]
-    if isinstance(string, Text):
-        s = [strip_punctuation(s) for s in string]
-    if continuous:
-        s = [sum(s, [])]
-    g = []
+def _ngrams_sentences(string, punctuation=PUNCTUATION):
+    """ Yields a list of words for each sentence in the given string, list of words,
+        Sentence, Text, or iterable of these (e.g., a file, where each line is tokenized).
+        Punctuation marks are stripped from words.
+    """
+    p = set(punctuation)
+    if isinstance(string, (str, bytes, Sentence)) or \
+       isinstance(string, list) and not isinstance(string, Text):
+        string = (string,)
+    for s in string:
+        if isinstance(s, bytes):
+            s = decode_utf8(s)
+        if isinstance(s, str):
+            for s in tokenize(s):
+                yield [w for w in s.split(" ") if w not in p]
+        elif isinstance(s, Text):
+            for s in s:
+                yield [w for w in s if w.string not in p]
+        else:
+            yield [w for w in s if (isinstance(w, Word) and w.string or w) not in p]
 
-    for st in s:
-        # s = [None] + s + [None]
-        g.extend([tuple(st[i:i + n]) for i in range(len(st) - n + 1)])
-    return g
+
+def iter_ngrams(string, n=3, punctuation=PUNCTUATION, continuous=False):
+    """ Returns an iterator over the n-grams (tuples of n successive words) in the given string,
+        Text, Sentence, list of words, or iterable of these (e.g., an open file).
+        Sentences are read one by one, and a window of n words slides over them.
+        Word strings are interned, so that n-grams with the same words share them.
+    """
+    if n <= 0:
+        return
+    interned = {}
+    window = deque(maxlen=n)
+    for s in _ngrams_sentences(string, punctuation):
+        if not continuous:
+            window.clear()
+        for w in s:
+            if not isinstance(w, Word):
+                w = interned.setdefault(w, w)
+            window.append(w)
+            if len(window) == n:
+                yield tuple(window)
+
+
+def count_ngrams(string, n=3, punctuation=PUNCTUATION, continuous=False):
+    """ Returns a dictionary of (n-gram, count)-items for the given string,
+        Text, Sentence, list of words, or iterable of these (e.g., an open file).
+        The n-grams are tuples of word strings (for Word objects, Word.string).
+    """
+    if n <= 0:
+        return {}
+    # Words are counted as integer ids, so that a tuple of words
+    # is only created for each unique n-gram, not for each occurrence.
+    index = {}
+    count = Counter()
+    carry = []
+    for s in _ngrams_sentences(string, punctuation):
+        s = [index.setdefault(isinstance(w, Word) and w.string or w, len(index)) for w in s]
+        if continuous:
+            s = carry + s
+            carry = s[len(s) - n + 1:]
+        count.update(zip(*[s[i:] for i in range(n)]))
+    words = [None] * len(index)
+    for w, i in index.items():
+        words[i] = w
+    return dict((tuple(words[i] for i in k), v) for k, v in count.items())
 
 
 def split_document_by_delimeters(string, regexp="[.,!?;: ]", min_word_len=1, stopwords=None):
@@ -360,6 +415,8 @@ def pprint(string, token=[WORD, POS, CHUNK, PNP], column=4):
 
 class lazydict(dict):
 
+    _version = 0 # Number of changes with lazydict[k] = v, lazydict.update(), ...
+
     def load(self):
         # Must be overridden in a subclass.
         # Must load data with dict.__setitem__(self, k, v) instead of lazydict[k] = v.
@@ -370,10 +427,30 @@ class lazydict(dict):
             Replaces lazydict.method() with dict.method() and calls it.
         """
         if dict.__len__(self) == 0:
-            self.load()
+            resources.load(self)
             setattr(self, method, types.MethodType(getattr(dict, method), self))
         return getattr(dict, method)(self, *args)
 
+    def _change(self, method, *args):
+        """ If the dictionary is empty, calls lazydict.load().
+            Calls dict.method() and increments lazydict._version,
+            so that subclasses can rebuild data derived from the dictionary (e.g., a trie).
+        """
+        if dict.__len__(self) == 0:
+            resources.load(self)
+        self._version += 1
+        return getattr(dict, method)(self, *args)
+
+    def __reduce__(self):
+        # Pickled with the loaded data, which is restored without calling load().
+        state = dict((k, v) for k, v in self.__dict__.items() if not isinstance(v, types.MethodType))
+        return (self.__class__.__new__, (self.__class__,), (state, dict(dict.items(self))))
+
+    def __setstate__(self, state):
+        state, data = state
+        self.__dict__.update(state)
+        dict.update(self, data)
+
     def __repr__(self):
         return self._lazy("__repr__")
 
@@ -390,13 +467,13 @@ class lazydict(dict):
         return self._lazy("__getitem__", *args)
 
     def __setitem__(self, *args):
-        return self._lazy("__setitem__", *args)
+        return self._change("__setitem__", *args)
 
     def __delitem__(self, *args):
-        return self._lazy("__delitem__", *args)
+        return self._change("__delitem__", *args)
 
     def setdefault(self, *args):
-        return self._lazy("setdefault", *args)
+        return self._change("setdefault", *args)
 
     def get(self, *args, **kwargs):
         return self._lazy("get", *args)
@@ -411,13 +488,17 @@ class lazydict(dict):
         return self._lazy("values")
 
     def update(self, *args):
-        return self._lazy("update", *args)
+        return self._change("update", *args)
 
     def pop(self, *args):
-        return self._lazy("pop", *args)
+        return self._change("pop", *args)
 
     def popitem(self, *args):
-        return self._lazy("popitem", *args)
+        return self._change("popitem", *args)
+
+    def clear(self):
+        self._version += 1
+        return dict.clear(self)
 
 
 # --- LAZY LIST -------------------------------------------------------------------------------------
@@ -435,10 +516,20 @@ class lazylist(list):
             Replaces lazylist.method() with list.method() and calls it.
         """
         if list.__len__(self) == 0:
-            self.load()
+            resources.load(self)
             setattr(self, method, types.MethodType(getattr(list, method), self))
         return getattr(list, method)(self, *args)
 
+    def __reduce__(self):
+        # Pickled with the loaded data, which is restored without calling load().
+        state = dict((k, v) for k, v in self.__dict__.items() if not isinstance(v, types.MethodType))
+        return (self.__class__.__new__, (self.__class__,), (state, list(list.__iter__(self))))
+
+    def __setstate__(self, state):
+        state, data = state
+        self.__dict__.update(state)
+        list.extend(self, data)
+
     def __repr__(self):
         return self._lazy("__repr__")
 
@@ -498,10 +589,20 @@ class lazyset(set):
         """
         print("!")
         if set.__len__(self) == 0:
-            self.load()
+            resources.load(self)
             setattr(self, method, types.MethodType(getattr(set, method), self))
         return getattr(set, method)(self, *args)
 
+    def __reduce__(self):
+        # Pickled with the loaded data, which is restored without calling load().
+        state = dict((k, v) for k, v in self.__dict__.items() if not isinstance(v, types.MethodType))
+        return (self.__class__.__new__, (self.__class__,), (state, set(set.__iter__(self))))
+
+    def __setstate__(self, state):
+        state, data = state
+        self.__dict__.update(state)
+        set.update(self, data)
+
     def __repr__(self):
         return self._lazy("__repr__")
 
@@ -581,6 +682,150 @@ class lazyset(set):
         return self._lazy("difference", *args)
 
 
+# --- RESOURCES -------------------------------------------------------------------------------------
+# Lazy dictionaries and lists (Lexicon, Frequency, Spelling, Verbs, Sentiment, ...) are loaded
+# with resources.load(), which keeps the load time and estimated memory of each in resources.stats.
+# Words and tags are interned with resources.intern(), so that a string that occurs in several
+# resources or languages (e.g., "NN", "de", "la") is stored once (and released when none uses it).
+# A resource with a _share() method (e.g., Lexicon) is parsed once for each path,
+# other instances with the same path copy the data from the first, as long as it is unchanged.
+# After resources.open(path), resource files are read from a memory-mapped bundle,
+# so that processes share one copy in the OS page cache (see Resources.bundle()).
+
+
+class Resources(object):
+
+    def __init__(self):
+        """ A registry of the resources loaded in this process.
+        """
+        self.stats = {}     # {path: {"type": "Lexicon", "items": 100000, "time": 0.1, "memory": 8000000}}
+        self._loaded = {}   # {(Lexicon, path, mtime): (weakref.ref(Lexicon), version)}
+        self._bundle = None # (mmap, offset, {"en/en-lexicon.txt": (offset, length)})
+
+    def intern(self, s):
+        """ Returns the shared copy of the given string.
+        """
+        # Interned strings are released once no resource refers to them.
+        return sys.intern(s)
+
+    def load(self, resource):
+        """ Loads the given lazy resource with resource.load(),
+            or copies the data parsed for a resource of the same type and file.
+        """
+        path = getattr(resource, "path", None)
+        k = None
+        if isinstance(path, str) and hasattr(resource, "_share"):
+            f = os.path.realpath(path)
+            k = (resource.__class__, f, os.path.getmtime(f) if os.path.isfile(f) else None)
+        r, v = self._loaded.get(k, (None, None))
+        r = r and r()
+        t = time()
+        if r is not None and r is not resource and r._version == v:
+            # The data is shared with a resource that has not changed since it was parsed.
+            resource._share(r)
+        else:
+            resource.load()
+            r = None
+        t = time() - t
+        if k and r is None:
+            self._loaded[k] = (weakref.ref(resource), resource._version)
+        self.stats[path if isinstance(path, str) else resource.__class__.__name__] = {
+             "type": resource.__class__.__name__,
+            "items": self._values(resource)[0],
+             "time": t,
+           "memory": self._sizeof(resource)
+        }
+
+    def _values(self, resource):
+        # Returns a (length, iterator)-tuple.
+        # Bypass lazydict.values(), which calls Resources.load() again if empty.
+        if isinstance(resource, dict):
+            return dict.__len__(resource), iter(dict.items(resource))
+        if isinstance(resource, list):
+            return list.__len__(resource), list.__iter__(resource)
+        if isinstance(resource, set):
+            return set.__len__(resource), set.__iter__(resource)
+        return 0, iter(())
+
+    def _sizeof(self, resource, sample=100):
+        """ Returns the estimated size in bytes of the given resource:
+            the container, and the average size of the first items times the number of items.
+            Keys shared with other resources are counted in each, string values (e.g., tags) are not.
+        """
+        n, v = self._values(resource)
+        m = 0
+        i = 0
+        for i, x in enumerate(islice(v, sample), 1):
+            if isinstance(x, tuple) and len(x) == 2 and isinstance(resource, dict):
+                m += sys.getsizeof(x[0])
+                m += sys.getsizeof(x[1]) if not isinstance(x[1], str) else 0
+            else:
+                m += sys.getsizeof(x)
+        return sys.getsizeof(resource) + m * n // max(i, 1)
+
+    @property
+    def memory(self):
+        """ Yields the estimated size in bytes of the loaded resources.
+        """
+        return sum(v["memory"] for v in self.stats.values())
+
+    def _name(self, path):
+        """ Returns the path of the given file relative to pattern.text (e.g., "en/en-lexicon.txt"),
+            or None if the file is not in pattern.text.
+        """
+        f = os.path.relpath(os.path.realpath(path), os.path.realpath(MODULE))
+        if f == os.pardir or f.startswith(os.pardir + os.sep) or os.path.isabs(f):
+            return None
+        return f.replace(os.sep, "/")
+
+    def bundle(self, path, paths=[]):
+        """ Writes the given resource files (by default, all language resources)
+            to a single file at the given path, that can be memory-mapped with Resources.open().
+            Files are stored by path relative to pattern.text (e.g., "en/en-lexicon.txt").
+            Raises a ValueError for files that are not in pattern.text.
+        """
+        paths = paths or sorted(glob.glob(os.path.join(MODULE, "*", "*-*.txt")))
+        index, i = {}, 0
+        for f in paths:
+            if self._name(f) is None:
+                raise ValueError("%s is not in %s" % (f, MODULE))
+            index[self._name(f)] = (i, os.path.getsize(f))
+            i += os.path.getsize(f)
+        with open(path, "wb") as f:
+            f.write(json.dumps(index).encode("utf-8") + b"\n")
+            for x in paths:
+                with open(x, "rb") as x:
+                    f.write(x.read())
+
+    def open(self, path):
+        """ Memory-maps the bundle at the given path.
+            Resources loaded afterwards read their file from the bundle, if it has the file.
+        """
+        with open(path, "rb") as f:
+            m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        i = m.find(b"\n")
+        self.close()
+        self._bundle = (m, i + 1, json.loads(m[:i].decode("utf-8")))
+
+    def close(self):
+        if self._bundle:
+            self._bundle[0].close()
+            self._bundle = None
+
+    def lines(self, path):
+        """ Returns the list of lines of the file at the given path from the bundle, or None.
+        """
+        if self._bundle is None or not isinstance(path, str):
+            return None
+        m, i, index = self._bundle
+        try:
+            j, n = index[self._name(path)]
+        except KeyError:
+            return None
+        return m[i + j:i + j + n].decode("utf-8").splitlines()
+
+resources = Resources()
+
 #### PARSER ########################################################################################
 # Pattern's text parsers are based on Brill's algorithm, or optionally on a trained language model.
 # Brill's algorithm automatically acquires a lexicon of known words (aka tag dictionary),
@@ -598,7 +843,11 @@ def _read(path, encoding="utf-8", comment=";;;"):
         strippping comments and decoding each line to Unicode.
     """
     if path:
-        if isinstance(path, str) and os.path.exists(path):
+        f = resources.lines(path)
+        if f is not None:
+            # From bundle.
+            pass
+        elif isinstance(path, str) and os.path.exists(path):
             # From file path.
             f = open(path, "r", encoding="utf-8")
         elif isinstance(path, str):
@@ -630,7 +879,14 @@ class Lexicon(lazydict):
 
     def load(self):
         # Arnold NNP x
-        dict.update(self, (x.split(" ")[:2] for x in _read(self._path) if len(x.split(" ")) > 1))
+        intern = resources.intern
+        for x in _read(self._path):
+            x = x.split(" ")
+            if len(x) > 1:
+                dict.__setitem__(self, intern(x[0]), intern(x[1]))
+
+    def _share(self, lexicon):
+        dict.update(self, dict.items(lexicon))
 
 
 # --- FREQUENCY -------------------------------------------------------------------------------------
@@ -649,9 +905,13 @@ class Frequency(lazydict):
 
     def load(self):
         # and 0.4805
+        intern = resources.intern
         for x in _read(self.path):
             x = x.split()
-            dict.__setitem__(self, x[0], float(x[1]))
+            dict.__setitem__(self, intern(x[0]), float(x[1]))
+
+    def _share(self, frequency):
+        dict.update(self, dict.items(frequency))
 
 
 # --- LANGUAGE MODEL --------------------------------------------------------------------------------
@@ -706,6 +966,79 @@ class Model(object):
         """
         self._classifier.train(self._v(token, previous, next), type=tag)
 
+    def train_many(self, corpus, iterations=1, shuffle=True, checkpoint=None, every=10000, shards=10, seed=0, callback=None):
+        """ Trains the model on the given corpus, an iterator of sentences (lists of (token, tag)-tuples),
+            or a file path with one tagged sentence per line ("The/DT cat/NN sat/VBD").
+            With iterations > 1, the corpus is first copied to shard files,
+            which are read in a random order (each shard shuffled, if shuffle=True)
+            in each iteration, so that only one shard is kept in memory.
+            With a checkpoint (file path), the model and the training state are saved
+            every given number of sentences, and an existing checkpoint is resumed.
+            The checkpoint is a model file, i.e., Model(path=checkpoint).
+            Returns a dict with the trained iterations, sentences, tokens, time and tokens per second,
+            which is passed to callback(stats) after each checkpoint.
+        """
+        stats = {"iteration": 0, "sentences": 0, "tokens": 0, "time": 0.0, "speed": 0.0}
+        done = False
+        # Resume training from checkpoint.
+        r = (0, 0) # (iteration, sentence)
+        if checkpoint and os.path.exists(checkpoint):
+            m = Model(path=checkpoint)
+            self._classifier = m._classifier
+            self.unknown = m.unknown
+            r = self._classifier._data.get("model_training", r)
+        # Copy the corpus to shards.
+        files = None
+        if iterations > 1 and r[0] < iterations:
+            d = checkpoint and checkpoint + ".shards" or tempfile.mkdtemp(prefix="pattern-model-")
+            files = _shard(corpus, d, shards, seed)
+        t = time()
+        try:
+            for i in range(r[0], iterations):
+                if files:
+                    sentences = _shuffled(files, Random(seed + i), shuffle)
+                else:
+                    sentences = _tagged(corpus)
+                for j, s in enumerate(sentences):
+                    if i == r[0] and j < r[1]:
+                        continue
+                    for k, (w, tag) in enumerate(s):
+                        self.train(w, tag,
+                            previous = k > 0 and s[k - 1] or None,
+                                next = k < len(s) - 1 and s[k + 1] or None)
+                    stats["iteration"] = i
+                    stats["sentences"] += 1
+                    stats["tokens"] += len(s)
+                    if checkpoint and (j + 1) % every == 0:
+                        self._checkpoint(checkpoint, (i, j + 1), stats, t, callback)
+                if checkpoint:
+                    self._checkpoint(checkpoint, (i + 1, 0), stats, t, callback)
+            done = True
+        finally:
+            # Shards of an unfinished checkpoint are kept to resume.
+            if files and (done or not checkpoint):
+                for f in files + [os.path.join(d, "shards.json")]:
+                    os.remove(f)
+                os.rmdir(d)
+        stats["iteration"] = iterations
+        stats["time"] = time() - t
+        stats["speed"] = stats["tokens"] / (stats["time"] or 1)
+        self._classifier._data.pop("model_training", None)
+        return stats
+
+    def _checkpoint(self, path, state, stats, t, callback=None):
+        """ Saves the model and the training state (iteration, sentence) to the given path.
+        """
+        self._classifier._data["model_training"] = state
+        self.save(path + ".tmp")
+        if os.path.exists(path):
+            os.remove(path)
+        os.rename(path + ".tmp", path)
+        stats["time"] = time() - t
+        stats["speed"] = stats["tokens"] / (stats["time"] or 1)
+        if callback:
+            callback(stats)
+
     def classify(self, token, previous=None, next=None, **kwargs):
         """ Returns the predicted tag for the given token,
             in context of the given previous and next (token, tag)-tuples.
@@ -749,6 +1082,89 @@ class Model(object):
     description = property(_get_description, _set_description)
 
 
+
+def _tagged(corpus):
+    """ Yields lists of (token, tag)-tuples from the given list of tagged sentences,
+        or from the file at the given path, with one sentence per line ("The/DT cat/NN").
+    """
+    if isinstance(corpus, str):
+        corpus = _read(corpus)
+    for s in corpus:
+        if isinstance(s, str):
+            s = [w.rsplit("/", 1) for w in s.split(" ")]
+            s = [(w[0].replace("&slash;", "/"), w[1]) for w in s if len(w) == 2]
+        yield s
+
+
+def _lines(corpus):
+    """ Yields a line for each sentence in the given corpus (see _tagged()), e.g., "The/DT cat/NN".
+    """
+    for s in _tagged(corpus):
+        yield " ".join("%s/%s" % (w.replace("/", "&slash;"), tag) for w, tag in s)
+
+
+def _fingerprint(corpus, n=10, seed=0):
+    """ Returns a hash of the given corpus (see _tagged()) and shard parameters,
+        or None if the corpus is an iterator that can only be read once.
+        For a file path, the file size and modification time are hashed (not the content).
+    """
+    h = md5(("%s %s\n" % (n, seed)).encode("utf-8"))
+    if isinstance(corpus, str):
+        p = os.path.realpath(corpus)
+        h.update(("%s %s %s" % (p, os.path.getsize(p), os.path.getmtime(p))).encode("utf-8"))
+    elif isinstance(corpus, (list, tuple)):
+        for s in _lines(corpus):
+            h.update((s + "\n").encode("utf-8"))
+    else:
+        return None
+    return h.hexdigest()
+
+
+def _shard(corpus, path, n=10, seed=0):
+    """ Writes the given corpus (see _tagged()) to n files in the folder at the given path,
+        assigning each sentence to a random file, and returns the list of file paths.
+        If the folder already has the shards of the same corpus
+        (e.g., from an interrupted Model.train_many()), reuses them.
+    """
+    p = os.path.join(path, "shards.json")
+    k = _fingerprint(corpus, n, seed)
+    if os.path.exists(p):
+        with open(p, "r", encoding="utf-8") as f:
+            m = json.load(f)
+        if k is not None and m.get("corpus") == k:
+            return m["files"]
+        for f in m.get("files", ()): # Shards of another corpus.
+            if os.path.exists(f):
+                os.remove(f)
+    if not os.path.exists(path):
+        os.makedirs(path)
+    r = Random(seed)
+    a = [os.path.join(path, "%s.txt" % i) for i in range(max(n, 1))]
+    b = [open(x, "w", encoding="utf-8") for x in a]
+    for s in _lines(corpus):
+        b[int(r.random() * len(b))].write(s + "\n")
+    for x in b:
+        x.close()
+    with open(p, "w", encoding="utf-8") as f:
+        f.write(str(json.dumps({"corpus": k, "files": a})))
+    return a
+
+
+def _shuffled(shards, random=Random(), shuffle=True):
+    """ Yields lists of (token, tag)-tuples from the given shard files,
+        in random order if shuffle=True.
+    """
+    shards = list(shards)
+    if shuffle:
+        random.shuffle(shards)
+    for f in shards:
+        with open(f, "r", encoding="utf-8") as f:
+            s = f.read().splitlines()
+        if shuffle:
+            random.shuffle(s)
+        for s in _tagged(x for x in s if x):
+            yield s
+
 # --- MORPHOLOGICAL RULES ---------------------------------------------------------------------------
 # Brill's algorithm generates lexical (i.e., morphological) rules in the following format:
 # NN s fhassuf 1 NNS x => unknown words ending in -s and tagged NN change to NNS.
@@ -963,6 +1379,7 @@ class Entities(lazydict):
             "loc",  # Locations: Washington/NNP-LOC
             "org",  # Organizations: Google/NNP-ORG
         ))
+        self._trie = None
 
     @property
     def path(self):
@@ -975,34 +1392,59 @@ class Entities(lazydict):
             x = [x.lower() for x in x.split()]
             dict.setdefault(self, x[0], []).append(x)
 
+    def _insert(self, trie, e):
+        # ["alexander", "the", "great", "pers"] => {"alexander": {"the": {"great": {None: "-PERS"}}}}
+        e, tag = (e[:-1], "-" + e[-1].upper()) if e[-1] in self._cmd else (e, "")
+        node = trie
+        for w in e:
+            node = node.setdefault(w, {})
+        node.setdefault(None, tag)  # The first entry wins.
+
+    def _compile(self):
+        """ Returns a token trie of the (lowercase) named entities, where None marks the end
+            of an entity and yields its tag suffix, e.g., {"new": {"york": {None: "-LOC"}}}.
+            Entities.append() updates the trie, other changes to the dictionary rebuild it
+            (e.g., Entities["new"] = [["new", "jersey", "loc"]], but not Entities["new"].append()).
+        """
+        n = (len(self), self._version)
+        if self._trie is None or self._trie[0] != n:
+            trie = {}
+            for a in dict.values(self):
+                for e in a:
+                    self._insert(trie, e)
+            self._trie = (n, trie)
+        return self._trie[1]
+
     def apply(self, tokens):
         """ Applies the named entity recognizer to the given list of tokens,
             where each token is a [word, tag] list.
         """
         # Note: we could also scan for patterns, e.g.,
         # "my|his|her name is|was *" => NNP-PERS.
+        trie = self._compile()
+        lower = [token[0].lower() for token in tokens]
+        n = len(tokens)
         i = 0
-        while i < len(tokens):
-            w = tokens[i][0].lower()
-            if RE_ENTITY1.match(w) \
-                    or RE_ENTITY2.match(w) \
-                    or RE_ENTITY3.match(w):
+        while i < n:
+            w = lower[i]
+            if ("@" in w or w.startswith(("http://", "www."))) and (
+                       RE_ENTITY1.match(w)
+                    or RE_ENTITY2.match(w)
+                    or RE_ENTITY3.match(w)):
                 tokens[i][1] = self.tag
-            if w in self:
-                for e in self[w]:
-                    # Look ahead to see if successive words match the named entity.
-                    e, tag = (e[:-1], "-" + e[-1].upper()) if e[-1] in self._cmd else (e, "")
-                    b = True
-                    for j, e in enumerate(e):
-                        if i + j >= len(tokens) or tokens[i + j][0].lower() != e:
-                            b = False
-                            break
-                    if b:
-                        for token in tokens[i:i + j + 1]:
-                            token[1] = token[1] if token[1].startswith(self.tag) else self.tag
-                            token[1] += tag
-                        i += j
-                        break
+            # Look ahead for the longest named entity starting at this token.
+            node, j, m = trie.get(w), i, None
+            while node is not None:
+                if None in node:
+                    m = (j, node[None])
+                j += 1
+                node = node.get(lower[j]) if j < n else None
+            if m is not None:
+                j, tag = m
+                for token in tokens[i:j + 1]:
+                    token[1] = token[1] if token[1].startswith(self.tag) else self.tag
+                    token[1] += tag
+                i = j
             i += 1
         return tokens
 
@@ -1011,7 +1453,10 @@ class Entities(lazydict):
             e.g., Entities.append("Hooloovoo", "PERS")
         """
         e = list(map(lambda s: s.lower(), entity.split(" ") + [name]))
+        trie = self._compile()
         self.setdefault(e[0], []).append(e)
+        self._insert(trie, e)
+        self._trie = ((len(self), self._version), trie)
 
     def extend(self, entities):
         for entity, name in entities:
@@ -1095,11 +1540,36 @@ class Parser(object):
             # Named entities.
             self.entities = Entities(path=entities, tag=default[1])
         if f(model):
-            # Word part-of-speech classifier.
+            # Word part-of-speech classifier (loaded on first use, see Parser.model).
+            self._model = model
+
+    @property
+    def model(self):
+        """ Yields the language model (e.g., SLP) for unknown words, or None.
+            The model is loaded from file on first access, e.g., by Parser.find_tags(),
+            so that importing a language module does not unpickle the classifier.
+        """
+        m = self._model
+        if isinstance(m, str) or hasattr(m, "read"):
             try:
-                self.model = Model(path=model)
+                m = self._model = Model(path=m)
             except ImportError:  # pattern.vector
-                pass
+                m = self._model = None
+        return m
+
+    @model.setter
+    def model(self, v):
+        self._model = v
+
+    def warmup(self):
+        """ Loads the lexicon, rules and language model, which are otherwise loaded on first use,
+            e.g., before forking worker processes that should share the data.
+        """
+        for v in (self.lexicon, self.frequency, self.morphology, self.context, self.entities):
+            if isinstance(v, (lazydict, lazylist)):
+                len(v)
+        self.model
+        return self
 
     def find_keywords(self, string, **kwargs):
         """ Returns a sorted list of keywords in the given string.
@@ -1110,6 +1580,15 @@ class Parser(object):
                              frequency=kwargs.pop("frequency", {}), **kwargs
                              )
 
+    def find_keywords_many(self, documents, **kwargs):
+        """ Returns an iterator of (id, keywords)-tuples for the given documents.
+        """
+        return find_keywords_many(documents,
+                                  parser=self,
+                                  top=kwargs.pop("top", 10),
+                                  frequency=kwargs.pop("frequency", {}), **kwargs
+                                  )
+
     def find_tokens(self, string, **kwargs):
         """ Returns a list of sentences from the given string.
             Punctuation marks are separated from each word by a space.
@@ -1764,13 +2243,15 @@ def find_keywords(string, parser, top=10, frequency={}, ignore=("rt",), pos=("NN
         e.g., {"the": 0.8, "cat": 0.1, ...}
     """
     lemmata = kwargs.pop("lemmata", kwargs.pop("stem", True))
+    idf = kwargs.pop("idf", {})
+    # Remove hashtags.
+    s = string.replace("#", ". ")
+    # Parse + chunk string (as a list of sentences, instead of a TaggedString to split).
+    s = parser.parse(s, chunks=True, lemmata=lemmata, collapse=False)
     t = []
     p = None
     n = 0
-    # Remove hashtags.
-    s = string.replace("#", ". ")
-    # Parse + chunk string.
-    for sentence in parser.parse(s, chunks=True, lemmata=lemmata).split():
+    for sentence in s:
         for w in sentence:  # [token, tag, chunk, preposition, lemma]
             if w[2].startswith(("B", "O")):
                 t.append([])
@@ -1829,13 +2310,19 @@ def find_keywords(string, parser, top=10, frequency={}, ignore=("rt",), pos=("NN
             m[k][4] |= 1 if noun and w[3].startswith("O") else 0
             m[k][5] |= 1 if noun and w == head else 0
     # Rate tf-idf.
-    if frequency:
+    # The idf-values of lemmata are cached in the given idf dictionary
+    # (e.g., across documents in find_keywords_many()).
+    if frequency and m:
+        f = w[0].lower() in frequency and frequency[w[0].lower()]
         for k in m:
             if not k.isalpha():  # @username, odd!ti's
                 df = 1.0
+            elif f is not False:
+                df = log(1.0 / max(f, 0.0001))
+            elif k in idf:
+                df = idf[k]
             else:
-                df = 1.0 / max(frequency.get(w[0].lower(), frequency.get(k, 0)), 0.0001)
-                df = log(df)
+                df = idf[k] = log(1.0 / max(frequency.get(k, 0), 0.0001))
             m[k][0] *= df
             # print k, m[k]
     # Sort candidates alphabetically by total score.
@@ -1849,6 +2336,36 @@ def find_keywords(string, parser, top=10, frequency={}, ignore=("rt",), pos=("NN
     return m
 
 
+def find_keywords_many(documents, parser, top=10, frequency={}, workers=1, **kwargs):
+    """ Returns an iterator of (id, keywords)-tuples for the given iterable of documents,
+        where each document is a string or an (id, string)-tuple (by default, id is the index).
+        The idf-values of the given frequency dictionary are computed once for all documents.
+        With workers > 1, the documents are parsed in a pool of processes, in chunks,
+        and the results are yielded in order as they become available.
+    """
+    documents = (d if isinstance(d, tuple) else (i, d) for i, d in enumerate(documents))
+    chunksize = kwargs.pop("chunksize", 64)
+    kwargs["idf"] = {}
+    if workers > 1:
+        parser.warmup() # Load once, before the pool is started.
+        pool = process_pool(workers, (parser, top, frequency, kwargs))
+        try:
+            for v in pool.imap(_find_keywords, documents, chunksize=chunksize):
+                yield v
+        finally:
+            pool.terminate()
+            pool.join()
+    else:
+        for id, s in documents:
+            yield id, find_keywords(s, parser, top, frequency, **dict(kwargs))
+
+
+def _find_keywords(document):
+    # find_keywords_many(workers=2) worker.
+    parser, top, frequency, kwargs = worker_state()
+    return document[0], find_keywords(document[1], parser, top, frequency, **dict(kwargs))
+
+
 #### COMMAND LINE ##################################################################################
 # The commandline() function enables command line support for a Parser.
 # The following code can be added to pattern.en, for example:
@@ -1868,6 +2385,9 @@ def commandline(parse=Parser().parse):
     p = optparse.OptionParser()
     p.add_option("-f", "--file", dest="file", action="store", help="text file to parse", metavar="FILE")
     p.add_option("-s", "--string", dest="string", action="store", help="text string to parse", metavar="STRING")
+    p.add_option("-i", "--stdin", dest="stdin", action="store_true", help="parse each line from standard input")
+    p.add_option("-S", "--serve", dest="serve", action="store_true", help="serve JSON requests (one per line)")
+    p.add_option("-u", "--socket", dest="socket", action="store", help="Unix socket to serve on", metavar="PATH")
     p.add_option("-O", "--tokenize", dest="tokenize", action="store_true", help="tokenize the input")
     p.add_option("-T", "--tags", dest="tags", action="store_true", help="parse part-of-speech tags")
     p.add_option("-C", "--chunks", dest="chunks", action="store_true", help="parse chunk tags")
@@ -1882,33 +2402,113 @@ def commandline(parse=Parser().parse):
         from pattern import __version__
         print(__version__)
         sys.path.pop(0)
-    # Either a text file (-f) or a text string (-s) must be supplied.
-    s = o.file and codecs.open(o.file, "r", o.encoding).read() or o.string
     # The given text can be parsed in two modes:
     # - implicit: parse everything (tokenize, tag/chunk, find relations, lemmatize).
     # - explicit: define what to parse manually.
+    explicit = False
+    for option in [o.tokenize, o.tags, o.chunks, o.relations, o.lemmata]:
+        if option is not None:
+            explicit = True
+            break
+    if not explicit:
+        a = {"encoding": o.encoding}
+    else:
+        a = {"tokenize": o.tokenize or False,
+             "tags": o.tags or False,
+             "chunks": o.chunks or False,
+             "relations": o.relations or False,
+             "lemmata": o.lemmata or False,
+             "encoding": o.encoding}
+    # The output can be either slash-formatted string or XML.
+    xml = "xml" in arguments
+    # A long-running process (-S) keeps the lexicon and language model in memory.
+    if o.serve:
+        serve(parse, path=o.socket, xml=xml, **a)
+        return
+    # Each line from standard input (-i) is parsed and printed, one at a time.
+    if o.stdin:
+        for s in iter(sys.stdin.readline, ""):
+            s = s.rstrip("\r\n")
+            if s:
+                s = parse(s, **a)
+                s = xml and Tree(s, s.tags).xml or s
+            sys.stdout.write(s + "\n")
+            sys.stdout.flush()
+        return
+    # Either a text file (-f) or a text string (-s) must be supplied.
+    s = o.file and codecs.open(o.file, "r", o.encoding).read() or o.string
     if s:
-        explicit = False
-        for option in [o.tokenize, o.tags, o.chunks, o.relations, o.lemmata]:
-            if option is not None:
-                explicit = True
-                break
-        if not explicit:
-            a = {"encoding": o.encoding}
-        else:
-            a = {"tokenize": o.tokenize or False,
-                 "tags": o.tags or False,
-                 "chunks": o.chunks or False,
-                 "relations": o.relations or False,
-                 "lemmata": o.lemmata or False,
-                 "encoding": o.encoding}
         s = parse(s, **a)
-        # The output can be either slash-formatted string or XML.
-        if "xml" in arguments:
+        if xml:
             s = Tree(s, s.tags).xml
         print(s)
 
 
+def _respond(parse, request, xml=False, **kwargs):
+    """ Returns a JSON response string for the given JSON request string, e.g.,
+        {"id": 1, "text": "The cat purs.", "lemmata": true} =>
+        {"id": 1, "result": "The/DT/B-NP/O/the cat/NN/I-NP/O/cat purs/VB/B-VP/O/pur ././O/O/."}
+        The request can set the parse() options: tokenize, tags, chunks, relations, lemmata, xml.
+        Errors are returned as {"id": 1, "error": "..."}.
+    """
+    id = None
+    try:
+        r = json.loads(request)
+        r = isinstance(r, dict) and r or {"text": r}
+        id = r.get("id")
+        a = dict(kwargs)
+        a.update((k, r[k]) for k in ("tokenize", "tags", "chunks", "relations", "lemmata") if k in r)
+        s = parse(r["text"], **a)
+        if r.get("xml", xml):
+            s = Tree(s, s.tags).xml
+        return json.dumps({"id": id, "result": str(s)})
+    except Exception as e:
+        return json.dumps({"id": id, "error": "%s: %s" % (e.__class__.__name__, e)})
+
+
+def serve(parse=Parser().parse, path=None, stdin=None, stdout=None, xml=False, **kwargs):
+    """ Serves requests to the given parse() function, one JSON request per line (see _respond()),
+        from standard input to standard output, or on the Unix socket at the given path
+        (raises a ValueError if another kind of file exists at the path).
+        The parser is warmed up first, so that each request is parsed with all data in memory.
+        Optional parameters are passed to parse().
+    """
+    parse("The cats were sitting on the mat.", relations=True, lemmata=True)
+    if path is None:
+        stdin = stdin or sys.stdin
+        stdout = stdout or sys.stdout
+        for r in iter(stdin.readline, ""):
+            if r.strip():
+                stdout.write(_respond(parse, r, xml, **kwargs) + "\n")
+                stdout.flush()
+        return
+    from socketserver import ThreadingMixIn, UnixStreamServer, StreamRequestHandler
+
+    class Server(ThreadingMixIn, UnixStreamServer):
+        daemon_threads = True
+
+    class Handler(StreamRequestHandler):
+        def handle(self):
+            for r in iter(self.rfile.readline, b""):
+                if r.strip():
+                    r = _respond(parse, r.decode("utf-8"), xml, **kwargs) + "\n"
+                    self.wfile.write(r.encode("utf-8"))
+                    self.wfile.flush()
+
+    if os.path.exists(path):
+        if not stat.S_ISSOCK(os.stat(path).st_mode):
+            raise ValueError("%s is not a socket" % path)
+        os.unlink(path) # Left by a server that was not closed.
+    server = Server(path, Handler)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.unlink(path)
+
+
 #### VERBS #########################################################################################
 
 # --- VERB TENSES -----------------------------------------------------------------------------------
@@ -2160,12 +2760,17 @@ class Verbs(lazydict):
     def load(self):
         # have,,,has,,having,,,,,had,had,haven't,,,hasn't,,,,,,,hadn't,hadn't
         id = self._format[TENSES_ID[INFINITIVE]]
+        intern = resources.intern
         for v in _read(self._path):
-            v = v.split(",")
+            v = [intern(x) for x in v.split(",")]
             dict.__setitem__(self, v[id], v)
             for x in (x for x in v if x):
                 self._inverse[x] = v[id]
 
+    def _share(self, verbs):
+        dict.update(self, dict.items(verbs))
+        self._inverse.update(verbs._inverse)
+
     @property
     def path(self):
         return self._path
@@ -2179,7 +2784,7 @@ class Verbs(lazydict):
         """ Yields a dictionary of (infinitive, [inflections])-items.
         """
         if dict.__len__(self) == 0:
-            self.load()
+            resources.load(self)
         return self
 
     @property
@@ -2187,7 +2792,7 @@ class Verbs(lazydict):
         """ Yields a dictionary of (inflected, infinitive)-items.
         """
         if dict.__len__(self) == 0:
-            self.load()
+            resources.load(self)
         return self._inverse
 
     @property
@@ -2205,7 +2810,7 @@ class Verbs(lazydict):
         """ Returns the infinitive form of the given verb, or None.
         """
         if dict.__len__(self) == 0:
-            self.load()
+            resources.load(self)
         if verb.lower() in self._inverse:
             return self._inverse[verb.lower()]
         if verb in self._inverse:
@@ -2355,6 +2960,19 @@ IRONY = "irony"  # sarcasm mark (!)
 NOUN, VERB, ADJECTIVE, ADVERB = \
     "NN", "VB", "JJ", "RB"
 
+def _polarity(emoticons={}):
+    """ Returns a dict of lowercase emoticons (or emoji) => polarity, in order of precedence,
+        for the given dict of (type, polarity) => emoticons.
+    """
+    m = {}
+    for (type, p), v in emoticons.items():
+        for e in v:
+            m.setdefault(e.lower(), p)
+    return m
+
+_EMOTICONS = _polarity(EMOTICONS)
+_EMOJI = _polarity(EMOJI)
+
 RE_SYNSET = re.compile(r"^[acdnrv][-_][0-9]+$")
 
 
@@ -2373,6 +2991,16 @@ class Score(tuple):
         self.assessments = assessments
 
 
+def _private(path):
+    """ Returns True if the folder at the given path belongs to the current user,
+        and other users can not write to it.
+    """
+    s = os.stat(path)
+    if hasattr(os, "getuid") and s.st_uid != os.getuid():
+        return False
+    return not s.st_mode & (stat.S_IWGRP | stat.S_IWOTH)
+
+
 class Sentiment(lazydict):
 
     def __init__(self, path="", language=None, synset=None, confidence=None, **kwargs):
@@ -2392,6 +3020,8 @@ class Sentiment(lazydict):
         self.modifiers = kwargs.get("modifiers", ("RB",))
         self.modifier = kwargs.get("modifier", lambda w: w.endswith("ly"))
         self.ngrams = kwargs.get("ngrams", 3)
+        self.cache = kwargs.get("cache", None)  # Compiled lexicon folder (None = no cache).
+        self._trie = None  # ((version, len(lexicon)), {word: {word: ... {None: True}}})
 
     @property
     def path(self):
@@ -2408,13 +3038,71 @@ class Sentiment(lazydict):
     def load(self, path=None):
         """ Loads the XML-file (with sentiment annotations) from the given path.
             By default, Sentiment.path is lazily loaded.
+            With a Sentiment.cache folder, the parsed lexicon is stored there as a JSON-file,
+            so that subsequent loads (e.g., in other processes) skip the XML parser.
         """
-        # <word form="great" wordnet_id="a-01123879" pos="JJ" polarity="1.0" subjectivity="1.0" intensity="1.0" />
-        # <word form="damnmit" polarity="-0.75" subjectivity="1.0" label="profanity" />
         if not path:
             path = self._path
         if not os.path.exists(path):
             return
+        words, synsets, labels, language = self._compile(path)
+        self._language = language or self._language
+        dict.update(self, words)
+        dict.update(self.labeler, labels)
+        dict.update(self._synsets, synsets)
+
+    def _compile(self, path):
+        """ Returns a (words, synsets, labels, language)-tuple for the XML-file at the given path,
+            from the compiled lexicon in Sentiment.cache if it is up-to-date.
+            The cache folder is created for the current user only (mode 700),
+            and it is not used if other users can write to it.
+        """
+        if not self.cache:
+            return self._parse(path)
+        k = os.path.realpath(path)
+        k = "%s %s %s %s %s" % (k, os.path.getmtime(k), os.path.getsize(k), self._confidence, self._synset)
+        k = md5(k.encode("utf-8")).hexdigest()
+        f = os.path.join(self.cache, "sentiment-%s.json" % k)
+        try:
+            if not os.path.exists(self.cache):
+                os.makedirs(self.cache, 0o700)
+            if not _private(self.cache):
+                return self._parse(path)
+        except (IOError, OSError):
+            return self._parse(path)
+        try:
+            with open(f, "r", encoding="utf-8") as fp:
+                m = json.load(fp)
+            # JSON has no None keys (pos=None), so each word has a list of (pos, scores)-items.
+            words = dict((w, dict(a)) for w, a in m["words"].items())
+            return words, m["synsets"], m["labels"], m["language"]
+        except Exception:
+            pass
+        words, synsets, labels, language = v = self._parse(path)
+        try:
+            # Write + rename is atomic for concurrent processes.
+            fd, tmp = tempfile.mkstemp(prefix="sentiment-", suffix=".tmp", dir=self.cache)
+            try:
+                with open(fd, "w", encoding="utf-8") as fp:
+                    fp.write(str(json.dumps({
+                           "words": dict((w, list(v.items())) for w, v in words.items()),
+                         "synsets": synsets,
+                          "labels": labels,
+                        "language": language
+                    })))
+                os.replace(tmp, f)
+            finally:
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+        except (IOError, OSError):
+            pass
+        return v
+
+    def _parse(self, path):
+        """ Returns a (words, synsets, labels, language)-tuple for the XML-file at the given path.
+        """
+        # <word form="great" wordnet_id="a-01123879" pos="JJ" polarity="1.0" subjectivity="1.0" intensity="1.0" />
+        # <word form="damnmit" polarity="-0.75" subjectivity="1.0" label="profanity" />
         words, synsets, labels = {}, {}, {}
         xml = cElementTree.parse(path)
         xml = xml.getroot()
@@ -2437,7 +3125,6 @@ class Sentiment(lazydict):
                     labels[w] = label
                 if synset:
                     synsets.setdefault(synset, []).append(psi)
-        self._language = xml.attrib.get("language", self._language)
         # Average scores of all word senses per part-of-speech tag.
         for w in words:
             words[w] = dict((pos, list(map(avg, zip(*psi)))) for pos, psi in words[w].items())
@@ -2447,9 +3134,24 @@ class Sentiment(lazydict):
         # Average scores of all synonyms per synset.
         for id, psi in synsets.items():
             synsets[id] = list(map(avg, zip(*psi)))
-        dict.update(self, words)
-        dict.update(self.labeler, labels)
-        dict.update(self._synsets, synsets)
+        return words, synsets, labels, xml.attrib.get("language")
+
+    def _ngrams(self):
+        """ Returns a token trie of the multiword entries in the lexicon, e.g.,
+            {"hit": {"the": {"spot": {None: True}}}}, where None marks the end of an entry.
+            The trie is rebuilt when the lexicon is loaded or changed (e.g., Sentiment.annotate()).
+        """
+        n = (self._version, dict.__len__(self))
+        if self._trie is None or self._trie[0] != n:
+            trie = {}
+            for k in dict.keys(self):
+                if " " in k:
+                    node = trie
+                    for w in k.split(" "):
+                        node = node.setdefault(w, {})
+                    node[None] = True
+            self._trie = (n, trie)
+        return self._trie[1]
 
     def synset(self, id, pos=ADJECTIVE):
         """ Returns a (polarity, subjectivity)-tuple for the given synset id.
@@ -2467,7 +3169,7 @@ class Sentiment(lazydict):
             if pos == ADVERB:
                 id = "r-" + id
         if dict.__len__(self) == 0:
-            self.load()
+            resources.load(self)
         try:
             return tuple(self._synsets[id])[:2]
         except KeyError:  # Some WordNet id's are not zero padded.
@@ -2534,6 +3236,129 @@ class Sentiment(lazydict):
                      subjectivity=avg(map(lambda w: (w[0], w[2]), a), weight),
                      assessments=a)
 
+    def score_many(self, texts, negation=True, ngrams=DEFAULT, assessments=False):
+        """ Returns a NumPy array with a (polarity, subjectivity)-row for each given string
+            (or list of words), equal to Sentiment.__call__() but computed in batch:
+            all words are mapped to lexicon ids once, and the averages (including modifiers
+            and negation) are computed with array operations over all texts together.
+            With assessments=True, returns an (array, assessments)-tuple,
+            with a list of Sentiment.assessments() for each text.
+        """
+        import numpy as np
+        ngrams = ngrams if ngrams != DEFAULT else self.ngrams
+        if dict.__len__(self) == 0:
+            resources.load(self)
+        # 1) Tokenize all texts into one flat list of words.
+        words = []
+        for s in texts:
+            if isinstance(s, str):
+                words.append([w.lower() for w in " ".join(self.tokenizer(s)).split()])
+            else:
+                words.append(list(s))
+        n = np.array([len(x) for x in words], dtype=int)
+        N = int(n.sum())
+        # 2) Map words to ids, and ids to lexicon scores and flags.
+        flat = list(chain(*words))
+        vocabulary = dict((w, j) for j, w in enumerate(dict.fromkeys(flat)))
+        ids = np.fromiter(map(vocabulary.__getitem__, flat), dtype=np.int64, count=N)
+        V = len(vocabulary) + 1 # +1 for empty input.
+        k = np.zeros(V, dtype=bool)  # Known word?
+        p = np.zeros(V)
+        s = np.zeros(V)
+        i = np.ones(V)
+        m = np.zeros(V, dtype=bool)  # Known modifier?
+        f = np.zeros(V, dtype=bool)  # Sentiment.modifier(w)?
+        g = np.zeros(V, dtype=bool)  # Negation?
+        e = np.zeros(V)  # Emoticon polarity (sum).
+        ne = np.zeros(V)  # Emoticon count.
+        h = np.zeros(V, dtype=bool)  # Handled by Sentiment.assessments().
+        L1 = np.zeros(V, dtype=bool)  # Unknown word clears modifier?
+        L2 = np.zeros(V, dtype=bool)  # Unknown word clears negation?
+        for w, j in vocabulary.items():
+            if w is None:
+                h[j] = True
+                continue
+            v = dict.get(self, w)
+            if v is not None and None in v:
+                k[j] = True
+                p[j], s[j], i[j] = v[None]
+                m[j] = any(map(v.__contains__, self.modifiers))
+            else:
+                L1[j] = len(w) > 2
+                L2[j] = len(w.strip("'")) > 1
+                if w.isalpha() is False and len(w) <= 5 and w not in PUNCTUATION:
+                    for E in (_EMOTICONS, _EMOJI):
+                        if w in E:
+                            e[j] += E[w]
+                            ne[j] += 1
+                    if ne[j] > 0 and len(w) <= 2:
+                        h[j] = True # ":)" retains a preceding modifier.
+            f[j] = bool(self.modifier(w))
+            g[j] = negation and w in self.negations
+            h[j] = h[j] or w in ("!", "(!)")
+        doc = np.repeat(np.arange(len(words)), n)
+        start = np.repeat(np.cumsum(n) - n, n)
+        # 3) Texts with exclamation marks, idioms or a modifier before a negation
+        #    ("really not good") are assessed one by one.
+        hard = np.zeros(len(words), dtype=bool)
+        hard[doc[h[ids]]] = True
+        idioms = {}
+        for w in dict.keys(self):
+            w = w.split(" ") if " " in w else ()
+            if 1 < len(w) <= ngrams and all(map(vocabulary.__contains__, w)):
+                idioms.setdefault(len(w), []).append([vocabulary[x] for x in w])
+        for j, w in idioms.items():
+            # Encode each sequence of j word ids as a single number.
+            y1 = np.zeros(max(N - j + 1, 0), dtype=object if V ** j > 2 ** 62 else np.int64)
+            y2 = np.zeros(len(w), dtype=y1.dtype)
+            for jj in range(j):
+                y1 = y1 * V + ids[jj:N - j + 1 + jj]
+                y2 = y2 * V + np.array([x[jj] for x in w], dtype=np.int64)
+            y1 = np.isin(y1, y2) & (doc[:N - j + 1] == doc[j - 1:])
+            hard[doc[:N - j + 1][y1]] = True
+        a = np.arange(N)
+
+        def last(mask):
+            # Index of the last position before each position where mask is True (or -1),
+            # within the same text.
+            y = np.maximum.accumulate(np.where(mask, a, -1)) if N else a
+            y = np.concatenate(([-1], y[:-1])) if N else a
+            return np.where(y >= start, y, -1)
+
+        K = k[ids]
+        prevK = last(K)   # Preceding known word.
+        prevL = last(~K & L1[ids])
+        prevN = last(K | ~K & (g[ids] | L2[ids]))
+        # Preceding modifier (not interrupted by a long unknown word).
+        M = (prevK >= 0) & m[ids[prevK]] & (prevL < prevK)
+        # Preceding negation (not interrupted by another word).
+        X = (prevN >= 0) & g[ids[prevN]]
+        # Unknown negation preceded by a modifier ("really not good").
+        Y = ~K & (g[ids] | X & ~L2[ids]) & M & f[ids[prevK]]
+        hard[doc[Y]] = True
+        # 4) Known words start a new assessment, or modify the preceding one ("very good").
+        I = np.where(X, 1.0 / np.where(i[ids] == 0, 1, i[ids]), i[ids])
+        P = np.where(M, np.clip(p[ids] * I[prevK], -1, 1), p[ids])
+        S = np.where(M, np.clip(s[ids] * I[prevK], -1, 1), s[ids])
+        K = K & ~hard[doc]
+        c = np.cumsum(K & ~M) - 1  # Assessment id.
+        z = np.nonzero(K)[0]
+        z = z[np.append(c[z][1:] != c[z][:-1], True)] if len(z) else z  # Last word in each assessment.
+        neg = np.bincount(c[K], weights=X[K], minlength=len(z)) > 0
+        P, S = np.where(neg, P[z] * -0.5, P[z]), S[z]
+        # 5) Average the assessments and emoticons per text.
+        E = ~k[ids] & ~hard[doc]
+        w1 = np.bincount(doc[z], minlength=len(words)) + np.bincount(doc[E], weights=ne[ids[E]], minlength=len(words))
+        w2 = np.bincount(doc[z], weights=P, minlength=len(words)) + np.bincount(doc[E], weights=e[ids[E]], minlength=len(words))
+        w3 = np.bincount(doc[z], weights=S, minlength=len(words)) + np.bincount(doc[E], weights=ne[ids[E]], minlength=len(words))
+        w1 = np.where(w1 == 0, 1, w1)
+        v = np.column_stack((w2 / w1, w3 / w1))
+        for j in np.nonzero(hard)[0]:
+            v[j] = self(words[j], negation, ngrams)
+        if assessments:
+            return v, [self.assessments(((w, None) for w in x), negation, ngrams) for x in words]
+        return v
+
     def assessments(self, words=[], negation=True, ngrams=DEFAULT):
         """ Returns a list of (chunk, polarity, subjectivity, label)-tuples for the given list of words:
             where chunk is a list of successive words: a known word optionally
@@ -2545,6 +3370,10 @@ class Sentiment(lazydict):
         a = []
         m = None  # Preceding modifier (i.e., adverb or adjective).
         n = None  # Preceding negation (e.g., "not beautiful").
+        if dict.__len__(self) == 0:
+            resources.load(self)
+        get = lambda w: dict.get(self, w)
+        trie = self._ngrams() if ngrams > 1 else {}
         while index < len(words):
             w, pos = words[index]
             # Only assess known words, preferably by part-of-speech tag.
@@ -2552,17 +3381,19 @@ class Sentiment(lazydict):
             if w is None:
                 index += 1
                 continue
-            for i in reversed(range(1, max(1, ngrams))):
-                # Known idioms ("hit the spot").
-                if index < len(words) - i:
-                    idiom = words[index:index + i + 1]
-                    idiom = " ".join(w_pos[0] or "END-OF-NGRAM" for w_pos in idiom)
-                    if idiom in self:
-                        w, pos = idiom, None
-                        index += i
-                        break
-            if w in self and pos in self[w]:
-                p, s, i = self[w][pos]
+            # Known idioms ("hit the spot"): longest match in the trie of multiword entries.
+            node, j, k = trie.get(w), 0, 0
+            while node is not None and j < ngrams - 1 and index + j + 1 < len(words):
+                j += 1
+                node = words[index + j][0] is not None and node.get(words[index + j][0]) or None
+                if node is not None and None in node:
+                    k = j
+            if k > 0:
+                w, pos = " ".join(w_pos[0] for w_pos in words[index:index + k + 1]), None
+                index += k
+            v = get(w)
+            if v is not None and pos in v:
+                p, s, i = v[pos]
                 # Known word not preceded by a modifier ("good").
                 if m is None:
                     a.append(dict(w=[w], p=p, s=s, i=i, n=1, x=self.labeler.get(w)))
@@ -2582,7 +3413,7 @@ class Sentiment(lazydict):
                 # Known word may be modifying the next word (i.e., it is a known adverb).
                 m = None
                 n = None
-                if pos and pos in self.modifiers or any(map(self[w].__contains__, self.modifiers)):
+                if pos and pos in self.modifiers or any(map(v.__contains__, self.modifiers)):
                     m = (w, pos)
                 if negation and w in self.negations:
                     n = w
@@ -2608,13 +3439,11 @@ class Sentiment(lazydict):
                 # Exclamation marks in parentheses indicate sarcasm.
                 if w == "(!)":
                     a.append(dict(w=[w], p=0.0, s=1.0, i=1.0, n=1, x=IRONY))
-                # EMOTICONS: {("grin", +1.0): set((":-D", ":D"))}
+                # EMOTICONS: {":-d": +1.0, ":d": +1.0}
                 if w.isalpha() is False and len(w) <= 5 and w not in PUNCTUATION:  # speedup
-                    for E in (EMOTICONS, EMOJI):
-                        for (type, p), e in E.items():
-                            if w in map(lambda e: e.lower(), e):
-                                a.append(dict(w=[w], p=p, s=1.0, i=1.0, n=1, x=MOOD))
-                                break
+                    for E in (_EMOTICONS, _EMOJI):
+                        if w in E:
+                            a.append(dict(w=[w], p=E[w], s=1.0, i=1.0, n=1, x=MOOD))
             index += 1
         for i in range(len(a)):
             w = a[i]["w"]
@@ -2672,17 +3501,27 @@ class Spelling(lazydict):
     # cyrillic alphabet
     CYRILLIC = 'абвгдеёжзийклмнопрстуфхцчшщьыъэюя'
 
-    def __init__(self, path="", alphabet='LATIN'):
+    def __init__(self, path="", alphabet='LATIN', cache=10000, ttl=None):
+        """ A dictionary of known words and their frequency, used for spelling correction.
+            Spelling.suggest_many() caches the suggestions for the given number of words,
+            optionally for at most ttl seconds.
+        """
         self._path = path
         if alphabet == 'CYRILLIC':
             self.alphabet = Spelling.CYRILLIC
         else:
             self.alphabet = Spelling.LATIN
+        self.cache = LRUCache(size=cache, ttl=ttl)
+        self._latency = deque(maxlen=1000) # Seconds per corrected word (cache miss).
 
     def load(self):
+        intern = resources.intern
         for x in _read(self._path):
             x = x.split()
-            dict.__setitem__(self, x[0], int(x[1]))
+            dict.__setitem__(self, intern(x[0]), int(x[1]))
+
+    def _share(self, spelling):
+        dict.update(self, dict.items(spelling))
 
     @property
     def path(self):
@@ -2737,7 +3576,7 @@ class Spelling(lazydict):
             based on the probability of known words with edit distance 1-2 from the given word.
         """
         if len(self) == 0:
-            self.load()
+            resources.load(self)
         if len(w) == 1:
             return [(w, 1.0)]  # I
         if w in PUNCTUATION:
@@ -2755,6 +3594,65 @@ class Spelling(lazydict):
         candidates = [(w.istitle() and x.title() or x, p) for p, x in candidates]  # case-sensitive
         return candidates
 
+    def _suggest(self, w):
+        """ Returns a (suggestions, duration)-tuple for the given word.
+        """
+        t = time()
+        return self.suggest(w), time() - t
+
+    def suggest_many(self, words, workers=1, processes=False):
+        """ Returns a list of suggest() results for the given list of words.
+            Each unique word is corrected once, and the results are cached (see Spelling.cache).
+            With workers > 1, uncached words are corrected in a pool of threads,
+            or in a pool of processes with processes=True.
+        """
+        if dict.__len__(self) == 0:
+            self.load() # Load once, before the pool is started.
+        words = list(words)
+        m = {}
+        for w in set(words):
+            v = self.cache.get(w)
+            if v is not None:
+                m[w] = v
+        a = [w for w in set(words) if w not in m]
+        if workers > 1 and len(a) > 1:
+            if processes:
+                pool = process_pool(workers, self)
+                f = _suggest
+            else:
+                from multiprocessing.pool import ThreadPool
+                pool = ThreadPool(processes=workers)
+                f = self._suggest
+            try:
+                r = pool.map(f, a, chunksize=max(1, len(a) // (workers * 4)))
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            r = [self._suggest(w) for w in a]
+        for w, (v, t) in zip(a, r):
+            self.cache.set(w, v)
+            self._latency.append(t)
+            m[w] = v
+        return [list(m[w]) for w in words]
+
+    @property
+    def stats(self):
+        """ Yields a dictionary with the cache hit rate of Spelling.suggest_many(),
+            and the 50th, 90th and 99th percentile latency (in seconds) of uncached words.
+        """
+        return {
+                "hits": self.cache.hits,
+              "misses": self.cache.misses,
+            "hit_rate": self.cache.hit_rate,
+             "latency": percentiles(self._latency)
+        }
+
+
+def _suggest(w):
+    # Spelling.suggest_many(processes=True) worker.
+    return worker_state()._suggest(w)
+
 
 #### MULTILINGUAL ##################################################################################
 # The default functions in each language submodule, with an optional language parameter:
@@ -2762,7 +3660,7 @@ class Spelling(lazydict):
 # print(parse("The cat sat on the mat.", language="en"))
 # print(parse("De kat zat op de mat.", language="nl"))
 
-LANGUAGES = ["en", "es", "de", "fr", "it", "nl", "pt"]
+LANGUAGES = ["en", "es", "de", "fr", "it", "nl", "pt", "ru"]
 
 _modules = {}
 
@@ -2784,17 +3682,145 @@ def _multilingual(function, *args, **kwargs):
     return getattr(_module(kwargs.pop("language", "en")), function)(*args, **kwargs)
 
 
+#--- LANGUAGE IDENTIFICATION -----------------------------------------------------------------------
+# The language of a string is predicted from its character trigrams ("_th", "the", "he_", ...),
+# using the log-probability of each trigram in each language (i.e., Naive Bayes).
+# The trigram profiles are precomputed from the word frequency lists (xx-spelling.txt)
+# with LanguageIdentifier.train(), so no language module or lexicon needs to be loaded.
+
+
+class LanguageIdentifier(lazydict):
+
+    def __init__(self, path=""):
+        """ A dictionary of character trigrams, each with a list of log-probabilities,
+            one for each language in LanguageIdentifier.languages.
+        """
+        self._path = path
+        self.languages = []
+        self.default = []  # Log-probability of unknown trigrams, for each language.
+
+    @property
+    def path(self):
+        return self._path
+
+    def load(self):
+        # ;;; languages en es de fr it nl pt ru
+        # ;;; default -11.72 -11.45 -11.63 -11.5 -11.81 -11.67 -11.29 -11.51
+        # the en -3.67
+        for x in _read(self._path, comment=None):
+            x = x.split()
+            if x[0] == ";;;" and x[1] == "languages":
+                self.languages = x[2:]
+            elif x[0] == ";;;" and x[1] == "default":
+                self.default = [float(v) for v in x[2:]]
+            elif x[0] != ";;;":
+                if not dict.__contains__(self, x[0]):
+                    dict.__setitem__(self, x[0], list(self.default))
+                dict.__getitem__(self, x[0])[self.languages.index(x[1])] = float(x[2])
+
+    @classmethod
+    def train(cls, paths={}, path="language.txt", top=2000):
+        """ Computes the trigram profiles from the given dictionary of (language, path)-items,
+            where each path is a word frequency list (e.g., "en-spelling.txt"),
+            and saves the top most frequent trigrams per language at the given path.
+        """
+        languages = sorted(paths)
+        default = []
+        profiles = {}
+        for xx in languages:
+            f = defaultdict(int)
+            for x in _read(paths[xx]):
+                x = x.split()
+                for w in _words(x[0]):
+                    for t in _trigrams(w):
+                        f[t] += int(x[1])
+            n = float(sum(f.values()))
+            # Unknown trigrams get half the probability of the least frequent known trigram.
+            f = sorted(f.items(), key=lambda kv: -kv[1])[:top]
+            profiles[xx] = [(t, log(v / n)) for t, v in f]
+            default.append(log(f[-1][1] / n / 2))
+        s = []
+        s.append(";;; languages %s" % " ".join(languages))
+        s.append(";;; default %s" % " ".join("%.2f" % v for v in default))
+        for xx in languages:
+            for t, v in profiles[xx]:
+                s.append("%s %s %.2f" % (t, xx, v))
+        f = open(path, "w", encoding="utf-8")
+        f.write("\n".join(s))
+        f.close()
+
+    def scores(self, s):
+        """ Returns a list of log-probabilities for the given string, one for each language.
+        """
+        if dict.__len__(self) == 0:
+            resources.load(self)
+        p = [0.0] * len(self.languages)
+        for w in _words(s):
+            for t in _trigrams(w):
+                v = self.get(t)
+                if v is not None:
+                    p = [a + b for a, b in zip(p, v)]
+        return p
+
+    def __call__(self, s):
+        """ Returns a (language, confidence)-tuple for the given string.
+        """
+        p = self.scores(s)
+        i = max(range(len(p)), key=lambda i: (p[i], self.languages[i] == "en")) # Prefer "en" if undecided.
+        return self.languages[i], 1.0 / sum(exp(v - p[i]) for v in p)
+
+    def many(self, strings=[]):
+        """ Returns a list of (language, confidence)-tuples for the given list of strings.
+            The known trigrams of all strings are looked up first,
+            and their log-probabilities are summed per string at once (numpy.add.at).
+        """
+        import numpy as np
+        if dict.__len__(self) == 0:
+            resources.load(self)
+        if not hasattr(self, "_matrix"):
+            self._index = {t: i for i, t in enumerate(self)}
+            self._matrix = np.array([self[t] for t in self._index] or np.zeros((0, len(self.languages))))
+        d, t = [], []
+        for i, s in enumerate(strings):
+            for w in _words(s):
+                for x in _trigrams(w):
+                    j = self._index.get(x)
+                    if j is not None:
+                        d.append(i)
+                        t.append(j)
+        P = np.zeros((len(strings), len(self.languages)))
+        np.add.at(P, np.array(d, dtype=int), self._matrix[np.array(t, dtype=int)])
+        P[:, self.languages.index("en")] += 1e-9  # Prefer "en" if undecided.
+        i = P.argmax(axis=1)
+        c = 1.0 / np.exp(P - P[np.arange(len(i)), i][:, None]).sum(axis=1)
+        return [(self.languages[i], float(c)) for i, c in zip(i, c)]
+
+
+def _words(s):
+    """ Returns a list of lowercase words (letters only) in the given string.
+    """
+    return re.findall(r"[^\W\d_]+", decode_utf8(s).lower(), re.U)
+
+
+def _trigrams(w):
+    """ Returns an iterator over the character trigrams in the given word, e.g., "_ca", "cat", "at_".
+    """
+    w = "_%s_" % w
+    return (w[i:i+3] for i in range(len(w) - 2))
+
+identifier = LanguageIdentifier(path=os.path.join(MODULE, "language.txt"))
+
+
 def language(s):
     """ Returns a (language, confidence)-tuple for the given string.
     """
-    s = decode_utf8(s)
-    s = set(w.strip(PUNCTUATION) for w in s.replace("'", "' ").split())
-    n = float(len(s) or 1)
-    p = {}
-    for xx in LANGUAGES:
-        lexicon = _module(xx).__dict__["lexicon"]
-        p[xx] = sum(1 for w in s if w in lexicon) / n
-    return max(p.items(), key=lambda kv: (kv[1], int(kv[0] == "en")))
+    return identifier(s)
+
+
+def language_many(strings=[]):
+    """ Returns a list of (language, confidence)-tuples for the given list of strings.
+    """
+    return identifier.many(strings)
 
 
 lang = language
@@ -2824,6 +3850,10 @@ def keywords(*args, **kwargs):
     return _multilingual("keywords", *args, **kwargs)
 
 
+def keywords_many(*args, **kwargs):
+    return _multilingual("keywords_many", *args, **kwargs)
+
+
 def suggest(*args, **kwargs):
     return _multilingual("suggest", *args, **kwargs)
 
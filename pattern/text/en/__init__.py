@@ -27,8 +27,8 @@ sys.path.insert(0, os.path.join(MODULE, "..", "..", "..", ".."))
 
 # Import parser base classes.
 from pattern.text import (
-    Lexicon, Model, Morphology, Context, Parser as _Parser, ngrams, pprint, commandline,
-    PUNCTUATION
+    Lexicon, Model, Morphology, Context, Parser as _Parser, ngrams, iter_ngrams, count_ngrams,
+    pprint, commandline, PUNCTUATION
 )
 # Import parser universal tagset.
 from pattern.text import (
@@ -67,12 +67,13 @@ from pattern.text.en.inflect import (
 )
 # Import quantification functions.
 from pattern.text.en.inflect_quantify import (
-    number, numerals, quantify, reflect
+    number, numbers_many, numerals, quantify, reflect
 )
 # Import mood & modality functions.
 from pattern.text.en.modality import (
     mood, INDICATIVE, IMPERATIVE, CONDITIONAL, SUBJUNCTIVE,
     modality, uncertain, EPISTEMIC,
+    analyze, analyze_many,
     negated
 )
 # Import all submodules.
@@ -201,6 +202,16 @@ def keywords(s, top=10, **kwargs):
            "ignore": ("rt",)}, **kwargs))
 
 
+def keywords_many(documents, top=10, **kwargs):
+    """ Returns an iterator of (id, keywords)-tuples for the given list of strings.
+    """
+    return parser.find_keywords_many(documents, **dict({
+        "frequency": parser.frequency,
+              "top": top,
+              "pos": ("NN",),
+           "ignore": ("rt",)}, **kwargs))
+
+
 def suggest(w):
     """ Returns a list of (word, confidence)-tuples of spelling corrections.
     """
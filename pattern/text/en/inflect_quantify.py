@@ -27,6 +27,7 @@ except:
 
 sys.path.insert(0, os.path.join(MODULE, "..", "..", "..", ".."))
 
+from pattern.helpers import LRUCache
 from pattern.text.en.inflect import pluralize, referenced
 
 sys.path.pop(0)
@@ -84,6 +85,17 @@ for i, k in enumerate(ORDER[2:]):
 ZERO, MINUS, RADIX, THOUSANDS, CONJUNCTION = \
     "zero", "minus", "point", ",", "and"
 
+# Lookup table for number(), with each word and its type:
+# {"eleven": (1, 11), "dozen": (2, (12, 0.0)), "thousand": (3, 1000), "and": (4, None)}
+_NUMERAL, _VERBOSE, _ORDER, _CONJUNCTION = 1, 2, 3, 4
+_NUMBER_WORDS = {}
+_NUMBER_WORDS.update((w, (_NUMERAL, v)) for w, v in NUMERALS.items())
+_NUMBER_WORDS.update((w, (_VERBOSE, v)) for w, v in NUMERALS_VERBOSE.items())
+_NUMBER_WORDS.update((w, (_ORDER, v)) for w, v in O.items())
+_NUMBER_WORDS[CONJUNCTION] = (_CONJUNCTION, None)
+
+_ZSHIFT = re.compile(r"^(0|%s)\s*" % ZERO)
+
 
 def zshift(s):
     """ Returns a (string, count)-tuple, with leading zeros strippped from the string and counted.
@@ -91,13 +103,25 @@ def zshift(s):
     s = s.lstrip()
     i = 0
     while s.startswith((ZERO, "0")):
-        s = re.sub(r"^(0|%s)\s*" % ZERO, "", s, 1)
+        s = _ZSHIFT.sub("", s, 1)
         i = i + 1
     return s, i
 
 #print zshift("zero one")  # ("one", 1)
 #print zshift("0 0 seven") # ("seven", 2)
 
+#--- CACHE -----------------------------------------------------------------------------------------
+# number() and numerals() store the output for recent input,
+# since the same phrases ("twenty-five", "a hundred") tend to recur.
+# Each cache holds at most CACHE_SIZE items, the least recently used item is discarded first.
+
+CACHE_SIZE = 10000
+
+_number_cache = LRUCache(size=CACHE_SIZE)   # {"twenty-five": 25}
+_numerals_cache = LRUCache(size=CACHE_SIZE) # {(25, 2): "twenty-five"}
+
+_MISSING = object()
+
 #--- STRING TO NUMBER ------------------------------------------------------------------------------
 
 
@@ -109,11 +133,24 @@ def number(s):
         number("seventy-five point two") => 75.2
         number("three thousand and one") => 3001
     """
+    v = _number_cache.get(s, _MISSING)
+    if v is _MISSING:
+        v = _number_cache[s] = _number(s)
+    return v
+
+
+def numbers_many(strings):
+    """ Returns a list of numbers for the given list of numeric strings, see number().
+    """
+    return [number(s) for s in strings]
+
+
+def _number(s):
     s = s.strip()
     s = s.lower()
     # Negative number.
     if s.startswith(MINUS):
-        return -number(s.replace(MINUS, "", 1))
+        return -_number(s.replace(MINUS, "", 1))
     # Strip commas and dashes ("seventy-five").
     # Split into integral and fractional part.
     s = s.replace("&", " %s " % CONJUNCTION)
@@ -125,31 +162,32 @@ def number(s):
     if len(s) > 1:
         f = " ".join(s[1:])      # zero point zero twelve => zero twelve
         f, z = zshift(f)              # zero twelve => (1, "twelve")
-        f = float(number(f))          # "twelve" => 12.0
+        f = float(_number(f))         # "twelve" => 12.0
         f /= 10**(len(str(int(f))) + z) # 10**(len("12")+1) = 1000; 12.0 / 1000 => 0.012
     else:
         f = 0
     i = n = 0
     s = s[0].split()
     for j, x in enumerate(s):
-        if x in NUMERALS:
+        t, v = _NUMBER_WORDS.get(x, (None, None))
+        if t == _NUMERAL:
             # Map words from the dictionary of numerals: "eleven" => 11.
-            i += NUMERALS[x]
-        elif x in NUMERALS_VERBOSE:
+            i += v
+        elif t == _VERBOSE:
             # Map words from alternate numerals: "two dozen" => 2 * 12
-            i = i * NUMERALS_VERBOSE[x][0] + NUMERALS_VERBOSE[x][1]
-        elif x in O:
+            i = i * v[0] + v[1]
+        elif t == _ORDER:
             # Map thousands from the dictionary of orders.
             # When a thousand is encountered, the subtotal is shifted to the total
             # and we start a new subtotal. An exception to this is when we
             # encouter two following thousands (e.g. two million vigintillion is one subtotal).
-            i *= O[x]
+            i *= v
             if j < len(s) - 1 and s[j + 1] in O:
                 continue
-            if O[x] > 100:
+            if v > 100:
                 n += i
                 i = 0
-        elif x == CONJUNCTION:
+        elif t == _CONJUNCTION:
             pass
         else:
             # Words that are not in any dicionary may be numbers (e.g. "2.5" => 2.5).
@@ -177,6 +215,13 @@ def numerals(n, round=2):
         numerals(2.249) => two point twenty-five
         numerals(2.249, round=3) => two point two hundred and forty-nine
     """
+    v = _numerals_cache.get((n, round), _MISSING)
+    if v is _MISSING:
+        v = _numerals_cache[(n, round)] = _numerals(n, round)
+    return v
+
+
+def _numerals(n, round=2):
     if isinstance(n, str):
         if n.isdigit():
             n = int(n)
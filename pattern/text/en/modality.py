@@ -51,40 +51,60 @@ def verbs(sentence, i=0, j=None):
     return [w for w in sentence[i:j or len(sentence)] if verb(w)]
 
 
+def _parsed(sentence):
+    """ Returns a (words, tags, verbs, string)-tuple for the given parsed Sentence,
+        with the lowercase word strings, the part-of-speech tags, True for each verb
+        and the sentence string. The mood and modality functions share these lists,
+        instead of lowercasing words and searching verbs for each rule.
+    """
+    S = sentence
+    if not (hasattr(S, "words") and hasattr(S, "parse_token")):
+        raise TypeError("%s object is not a parsed Sentence" % repr(S.__class__.__name__))
+    W = S.words
+    return (
+        [w.string.lower() for w in W],
+        [w.type or "" for w in W],
+        [verb(w) for w in W],
+        S.string)
+
+
 def imperative(sentence, **kwargs):
     """ The imperative mood is used to give orders, commands, warnings, instructions, 
         or to make requests (if used with "please").
         It is marked by the infinitive form of the verb, without "to":
         "For goodness sake, just stop it!"
     """
-    S = sentence
-    if not (hasattr(S, "words") and hasattr(S, "parse_token")):
-        raise TypeError("%s object is not a parsed Sentence" % repr(S.__class__.__name__))
-    if question(S):
+    return _imperative(sentence, *_parsed(sentence))
+
+
+def _imperative(S, w, t, v, string, **kwargs):
+    if w and w[-1] == "?":
         return False
     if S.subjects and s(S.subjects[0]) not in ("you", "yourself"):
         # The subject can only identify as "you" (2sg): "Control yourself!".
         return False
-    r = s(S).rstrip(" .!")
+    r = string.lower().rstrip(" .!")
     for cc in ("if", "assuming", "provided that", "given that"):
         # A conjunction can also indicate conditional mood.
         if cc + " " in r:
             return False
-    for i, w in enumerate(S):
-        if verb(w):
-            if s(w) in ("do", "let") and w == verbs(S)[0]:
+    first = True
+    for i, x in enumerate(w):
+        if v[i]:
+            if x in ("do", "let") and first:
                 # "Do your homework!"
                 return True
-            if s(w) in ("do", "let"):
+            first = False
+            if x in ("do", "let"):
                 # "Let's not argue."
                 continue
-            if s(w) in ("would", "should", "'d", "could", "can", "may", "might"):
+            if x in ("would", "should", "'d", "could", "can", "may", "might"):
                 # "You should leave." => conditional.
                 return False
-            if s(w) in ("will", "shall") and i > 0 and s(S[i - 1]) == "you" and not verbs(S, 0, i):
+            if x in ("will", "shall") and i > 0 and w[i - 1] == "you" and not any(v[:i]):
                 # "You will eat your dinner."
                 continue
-            if w.type == "VB" and (i == 0 or s(S[i - 1]) != "to"):
+            if t[i] == "VB" and (i == 0 or w[i - 1] != "to"):
                 # "Come here!"
                 return True
             # Break on any other verb form.
@@ -120,33 +140,33 @@ def conditional(sentence, predictive=True, **kwargs):
         - "I will help you if you pay me" => speculative.
         Sentences with can/may always need an explicit if-clause.
     """
-    S = sentence
-    if not (hasattr(S, "words") and hasattr(S, "parse_token")):
-        raise TypeError("%s object is not a parsed Sentence" % repr(S.__class__.__name__))
-    if question(S):
+    return _conditional(sentence, *_parsed(sentence), predictive=predictive)
+
+
+def _conditional(S, w, t, v, string, predictive=True, **kwargs):
+    if w and w[-1] == "?":
         return False
-    i = find(lambda w: s(w) == "were", S)
-    i = i and i.index or 0
-    if i > 0 and (s(S[i - 1]) in ("i", "it", "he", "she") or S[i - 1].type == "NN"):
+    i = "were" in w and w.index("were") or 0
+    if i > 0 and (w[i - 1] in ("i", "it", "he", "she") or t[i - 1] == "NN"):
         # "As if it were summer already." => subjunctive (wish).
         return False
-    for i, w in enumerate(S):
-        if w.type == "MD":
-            if s(w) == "ought" and i < len(S) and s(S[i + 1]) == "to":
+    for i, x in enumerate(w):
+        if t[i] == "MD":
+            if x == "ought" and i < len(w) - 1 and w[i + 1] == "to":
                 # "I ought to help you."
                 return True
-            if s(w) in ("would", "should", "'d", "could", "might"):
+            if x in ("would", "should", "'d", "could", "might"):
                 # "I could help you."
                 return True
-            if s(w) in ("will", "shall", "'ll") and i > 0 and s(S[i - 1]) == "you" and not verbs(S, 0, i):
+            if x in ("will", "shall", "'ll") and i > 0 and w[i - 1] == "you" and not any(v[:i]):
                 # "You will help me." => imperative.
                 return False
-            if s(w) in ("will", "shall", "'ll") and predictive:
+            if x in ("will", "shall", "'ll") and predictive:
                 # "I will help you." => predictive.
                 return True
-            if s(w) in ("will", "shall", "'ll", "can", "may"):
+            if x in ("will", "shall", "'ll", "can", "may"):
                 # "I will help you when I get back." => speculative.
-                r = s(S).rstrip(" .!")
+                r = string.lower().rstrip(" .!")
                 for cc in ("if", "when", "once", "as soon as", "assuming", "provided that", "given that"):
                     if cc + " " in r:
                         return True
@@ -178,6 +198,9 @@ for w in list(subjunctive1): # Inflect.
     subjunctive1.append(w + "s")
     subjunctive1.append(w.rstrip("e") + "ed")
 
+_subjunctive1 = set(subjunctive1)
+_subjunctive2 = set(subjunctive2)
+
 
 def subjunctive(sentence, classical=True, **kwargs):
     """ The subjunctive mood is a classical mood used to express a wish, judgment or opinion.
@@ -185,41 +208,43 @@ def subjunctive(sentence, classical=True, **kwargs):
         preceded by an "it is"-statement:
         "It is recommended that he bring his own computer."
     """
-    S = sentence
-    if not (hasattr(S, "words") and hasattr(S, "parse_token")):
-        raise TypeError("%s object is not a parsed Sentence" % repr(S.__class__.__name__))
-    if question(S):
+    return _subjunctive(sentence, *_parsed(sentence), classical=classical)
+
+
+def _subjunctive(S, w, t, v, string, classical=True, **kwargs):
+    if w and w[-1] == "?":
         return False
-    for i, w in enumerate(S):
+    n = len(w)
+    for i, x in enumerate(w):
         b = False
-        if w.type.startswith("VB"):
-            if s(w).startswith("wish"):
+        if t[i].startswith("VB"):
+            if x.startswith("wish"):
                 # "I wish I knew."
                 return True
-            if s(w) == "hope" and i > 0 and s(S[i - 1]) in ("i", "we"):
+            if x == "hope" and i > 0 and w[i - 1] in ("i", "we"):
                 # "I hope ..."
                 return True
-            if s(w) == "were" and i > 0 and (s(S[i - 1]) in ("i", "it", "he", "she") or S[i - 1].type == "NN"):
+            if x == "were" and i > 0 and (w[i - 1] in ("i", "it", "he", "she") or t[i - 1] == "NN"):
                 # "It is as though she were here." => counterfactual.
                 return True
-            if s(w) in subjunctive1:
+            if x in _subjunctive1:
                 # "I propose that you be on time."
                 b = True
-            elif s(w) == "is" and 0 < i < len(S) - 1 and s(S[i - 1]) == "it" \
-             and s(S[i + 1]) in subjunctive2:
+            elif x == "is" and 0 < i < n - 1 and w[i - 1] == "it" \
+             and w[i + 1] in _subjunctive2:
                 # "It is important that you be there." => but you aren't (yet).
                 b = True
-            elif s(w) == "is" and 0 < i < len(S) - 3 and s(S[i - 1]) == "it" \
-             and s(S[i + 2]) in ("good", "bad") and s(S[i + 3]) == "idea":
+            elif x == "is" and 0 < i < n - 3 and w[i - 1] == "it" \
+             and w[i + 2] in ("good", "bad") and w[i + 3] == "idea":
                 # "It is a good idea that you be there."
                 b = True
         if b:
             # With classical=False, "It is important that you are there." passes.
             # This is actually an informal error: it states a fact, not a wish.
-            v = find(lambda w: w.type.startswith("VB"), S[i + 1:])
-            if v and classical is True and v and v.type == "VB":
+            j = find(lambda j: t[j].startswith("VB"), range(i + 1, n))
+            if j is not None and classical is True and t[j] == "VB":
                 return True
-            if v and classical is False:
+            if j is not None and classical is False:
                 return True
     return False
 
@@ -259,11 +284,15 @@ def mood(sentence, **kwargs):
             sentence = Sentence(parse(sentence))
         except ImportError:
             pass
-    if imperative(sentence, **kwargs):
+    return _mood(sentence, *_parsed(sentence), **kwargs)
+
+
+def _mood(S, w, t, v, string, **kwargs):
+    if _imperative(S, w, t, v, string, **kwargs):
         return IMPERATIVE
-    if conditional(sentence, **kwargs):
+    if _conditional(S, w, t, v, string, **kwargs):
         return CONDITIONAL
-    if subjunctive(sentence, **kwargs):
+    if _subjunctive(S, w, t, v, string, **kwargs):
         return SUBJUNCTIVE
     else:
         return INDICATIVE
@@ -423,45 +452,79 @@ def modality(sentence, type=EPISTEMIC):
             sentence = Sentence(parse(sentence))
         except ImportError:
             pass
-    S, n, m = sentence, 0.0, 0
-    if not (hasattr(S, "words") and hasattr(S, "parse_token")):
-        raise TypeError("%s object is not a parsed Sentence" % repr(S.__class__.__name__))
+    S = sentence
+    return _modality(S, *_parsed(S), type=type)
+
+
+def _compile():
+    """ Returns a (lexicon, weaseling, cache)-tuple, where lexicon is a list of (tag, {word: score}, weight),
+        weaseling a list of (phrase, score) and cache a dictionary of tag => [({word: score}, weight)].
+        The epistemic_* dictionaries are compiled again when the number of words in them changes.
+        Edits that keep the same number of words (e.g., a word that moves to another score)
+        are only picked up after setting _epistemic = None.
+    """
+    global _epistemic
+    lexicons = (
+      (  "MD", epistemic_MD, 4),
+      (  "VB", epistemic_VB, 2),
+      (  "RB", epistemic_RB, 2),
+      (  "JJ", epistemic_JJ, 1),
+      (  "NN", epistemic_NN, 1),
+      (  "CC", epistemic_CC_DT_IN, 1),
+      (  "DT", epistemic_CC_DT_IN, 1),
+      (  "IN", epistemic_CC_DT_IN, 1),
+      ("PRP" , epistemic_PRP, 1),
+      ("PRP$", epistemic_PRP, 1),
+      ( "WP" , epistemic_PRP, 1))
+    # Number of words in each lexicon.
+    n = [lexicon for tag, lexicon, weight in lexicons] + [epistemic_weaseling]
+    n = tuple(sum(len(v) for v in lexicon.values()) for lexicon in n)
+    if _epistemic is None or _epistemic[0] != n:
+        a = []
+        for tag, lexicon, weight in lexicons:
+            f = {}
+            for k, v in lexicon.items():
+                for w in v:
+                    f.setdefault(w, k) # Lowest score first.
+            a.append((tag, f, weight))
+        b = [(phrase, k) for k, v in epistemic_weaseling.items() for phrase in v]
+        _epistemic = (n, (a, b, {}))
+    return _epistemic[1]
+
+_epistemic = None # ((words per lexicon), (lexicon, weaseling, cache))
+
+
+def _modality(S, w, t, v, string, type=EPISTEMIC):
+    n, m = 0.0, 0
     if type == EPISTEMIC:
-        r = S.string.rstrip(" .!")
-        for k, v in epistemic_weaseling.items():
-            for phrase in v:
-                if phrase in r:
-                    n += k
-                    m += 2
-        for i, w in enumerate(S.words):
-            for type, dict, weight in (
-              (  "MD", epistemic_MD, 4),
-              (  "VB", epistemic_VB, 2),
-              (  "RB", epistemic_RB, 2),
-              (  "JJ", epistemic_JJ, 1),
-              (  "NN", epistemic_NN, 1),
-              (  "CC", epistemic_CC_DT_IN, 1),
-              (  "DT", epistemic_CC_DT_IN, 1),
-              (  "IN", epistemic_CC_DT_IN, 1),
-              ("PRP" , epistemic_PRP, 1),
-              ("PRP$", epistemic_PRP, 1),
-              ( "WP" , epistemic_PRP, 1)):
+        lexicon, weaseling, cache = _compile()
+        r = string.rstrip(" .!")
+        for phrase, k in weaseling:
+            if phrase in r:
+                n += k
+                m += 2
+        for i, x in enumerate(S.words):
+            # Lexicons for this tag, e.g., "PRP$" => epistemic_PRP (x2).
+            e = cache.get(t[i])
+            if e is None:
+                e = cache[t[i]] = [(f, weight) for tag, f, weight in lexicon if t[i].startswith(tag)]
+            if e:
                 # "likely" => weight 1, "very likely" => weight 2
-                if i > 0 and s(S[i - 1]) in MODIFIERS:
-                    weight += 1
-                # likely" => score 0.25 (neutral inclining towards positive).
-                if w.type and w.type.startswith(type):
-                    for k, v in dict.items():
-                        # Prefer lemmata.
-                        if (w.lemma or s(w)) in v:
-                            # Reverse score for negated terms.
-                            if i > 0 and s(S[i - 1]) in ("not", "n't", "never", "without"):
-                                k = -k * 0.5
-                            n += weight * k
-                            m += weight
-                            break
+                b1 = i > 0 and w[i - 1] in MODIFIERS
+                # Reverse score for negated terms.
+                b2 = i > 0 and w[i - 1] in ("not", "n't", "never", "without")
+                for f, weight in e:
+                    # Prefer lemmata.
+                    k = f.get(x.lemma or w[i])
+                    if k is not None:
+                        if b1:
+                            weight += 1
+                        if b2:
+                            k = -k * 0.5
+                        n += weight * k
+                        m += weight
             # Numbers, citations, explanations make the sentence more factual.
-            if w.type in ("CD", "\"", "'", ":", "("):
+            if t[i] in ("CD", "\"", "'", ":", "("):
                 n += 0.75
                 m += 1
     if m == 0:
@@ -472,6 +535,29 @@ def modality(sentence, type=EPISTEMIC):
 def uncertain(sentence, threshold=0.5):
     return modality(sentence) <= threshold
 
+#--- MOOD & MODALITY -------------------------------------------------------------------------------
+# analyze() returns both the mood and the modality of a sentence.
+# The words, tags and verbs are collected once and shared by all the rules.
+
+
+def analyze(sentence, type=EPISTEMIC, **kwargs):
+    """ Returns a (mood, modality)-tuple for the given parsed Sentence,
+        i.e., the same as (mood(sentence, **kwargs), modality(sentence, type)).
+    """
+    a = _parsed(sentence)
+    return _mood(sentence, *a, **kwargs), _modality(sentence, *a, type=type)
+
+
+def analyze_many(sentences, type=EPISTEMIC, **kwargs):
+    """ Returns an iterator of (mood, modality)-tuples for the given parsed Text,
+        or list of Sentences. A string is parsed first, with lemmata.
+    """
+    if isinstance(sentences, (str, bytes)):
+        from pattern.text.en import parsetree
+        sentences = parsetree(sentences, lemmata=True)
+    for S in sentences:
+        yield analyze(S, type, **kwargs)
+
 #from __init__ import parse, Sentence
 #
 #for str in (
@@ -45,14 +45,20 @@ except:
 #os.environ["WNHOME"] = os.path.join(MODULE, CORPUS)
 #os.environ["WNSEARCHDIR"] = os.path.join(MODULE, CORPUS, "dict")
 
-import nltk
-from nltk.corpus import wordnet as wn
-from nltk.corpus import sentiwordnet as swn
-from nltk.corpus import wordnet_ic as wn_ic
-from nltk.corpus.reader.wordnet import Synset as WordNetSynset
-
-# Make sure the necessary corpora are downloaded to the local drive
-for token in ("wordnet", "wordnet_ic", "sentiwordnet"):
+#### LOADER ########################################################################################
+# NLTK, the WordNet corpus readers and the information content (IC) tables are loaded on first use,
+# so that "import pattern.en" does not pay for them (importing nltk alone takes 1+ seconds).
+# Module attributes wn, swn, wn_ic, WordNetSynset, VERSION, brown_ic, IC_CORPUS and IC_MAX
+# are resolved lazily with __getattr__() (Python 3.7+); internal code calls _wordnet() or _ic().
+# Call load() to preload everything up front, e.g., in a server before forking workers.
+
+_loaded = set()
+
+
+def _download(token):
+    """ Makes sure the given NLTK corpus is downloaded to the local drive.
+    """
+    import nltk
     try:
         nltk.data.find("corpora/" + token)
     except LookupError:
@@ -64,14 +70,80 @@ for token in ("wordnet", "wordnet_ic", "sentiwordnet"):
             d = NLTKDownloader("http://nltk.github.com/nltk_data/")
             d.download(token, quiet = True, raise_on_error = True)
 
-# Use the Brown corpus for calculating information content (IC)
-brown_ic = wn_ic.ic('ic-brown.dat')
-IC_CORPUS, IC_MAX = brown_ic, {}
-for key in IC_CORPUS:
-    IC_MAX[key] = max(IC_CORPUS[key].values())
 
-# This will hold the WordNet version
-VERSION = wn.get_version() or "3.0"
+def _wordnet():
+    """ Returns the NLTK WordNet corpus reader, loading it on first call.
+    """
+    global wn, WordNetSynset, VERSION
+    if "wordnet" not in _loaded:
+        _download("wordnet")
+        from nltk.corpus import wordnet as wn
+        from nltk.corpus.reader.wordnet import Synset as WordNetSynset
+        # This will hold the WordNet version
+        VERSION = wn.get_version() or "3.0"
+        _loaded.add("wordnet")
+    return wn
+
+
+def _ic():
+    """ Returns the information content (IC) table of the Brown corpus, loading it on first call.
+    """
+    global wn_ic, brown_ic, IC_CORPUS, IC_MAX
+    if "wordnet_ic" not in _loaded:
+        _wordnet()
+        _download("wordnet_ic")
+        from nltk.corpus import wordnet_ic as wn_ic
+        # Use the Brown corpus for calculating information content (IC)
+        brown_ic = wn_ic.ic('ic-brown.dat')
+        IC_CORPUS, IC_MAX = brown_ic, {}
+        for key in IC_CORPUS:
+            IC_MAX[key] = max(IC_CORPUS[key].values())
+        _loaded.add("wordnet_ic")
+    return IC_CORPUS
+
+
+def _sentiwordnet():
+    """ Returns the NLTK SentiWordNet corpus reader, loading it on first call.
+    """
+    global swn
+    if "sentiwordnet" not in _loaded:
+        _wordnet()
+        _download("sentiwordnet")
+        from nltk.corpus import sentiwordnet as swn
+        _loaded.add("sentiwordnet")
+    return swn
+
+
+def load(ic=True, sentiwordnet=True):
+    """ Preloads WordNet, and optionally the information content (IC) and SentiWordNet.
+        Otherwise, each of these is loaded the first time it is needed.
+    """
+    _wordnet().ensure_loaded()
+    if ic:
+        _ic()
+    if sentiwordnet:
+        _sentiwordnet().ensure_loaded()
+
+preload = load
+
+_LAZY = {
+               "wn": _wordnet,
+    "WordNetSynset": _wordnet,
+          "VERSION": _wordnet,
+            "wn_ic": _ic,
+         "brown_ic": _ic,
+        "IC_CORPUS": _ic,
+           "IC_MAX": _ic,
+              "swn": _sentiwordnet
+}
+
+
+def __getattr__(name):
+    # Called for module attributes that do not exist (yet), e.g., wordnet.VERSION.
+    if name in _LAZY:
+        _LAZY[name]()
+        return globals()[name]
+    raise AttributeError("module %s has no attribute %s" % (repr(__name__), repr(name)))
 
 #---------------------------------------------------------------------------------------------------
 
@@ -111,18 +183,19 @@ def normalize(word):
 
 ### SYNSET #########################################################################################
 
-NOUNS = lambda: wn.all_lemma_names(wn.NOUN)
-VERBS = lambda: wn.all_lemma_names(wn.VERB)
-ADJECTIVES = lambda: wn.all_lemma_names(wn.ADJ)
-ADVERBS = lambda: wn.all_lemma_names(wn.ADV)
+NOUNS = lambda: _wordnet().all_lemma_names("n")
+VERBS = lambda: _wordnet().all_lemma_names("v")
+ADJECTIVES = lambda: _wordnet().all_lemma_names("a")
+ADVERBS = lambda: _wordnet().all_lemma_names("r")
 
 NOUN, VERB, ADJECTIVE, ADVERB = \
     NN, VB, JJ, RB = \
         "NN", "VB", "JJ", "RB"
 
-_pattern2wordnet = {NN : wn.NOUN, VB : wn.VERB, JJ : wn.ADJ, RB: wn.ADV}
+# Same as wn.NOUN, wn.VERB, wn.ADJ, wn.ADV and wn.ADJ_SAT, without loading WordNet.
+_pattern2wordnet = {NN : "n", VB : "v", JJ : "a", RB: "r"}
 _wordnet2pattern = {v : k for k, v in _pattern2wordnet.items()}
-_wordnet2pattern[wn.ADJ_SAT] = JJ
+_wordnet2pattern["s"] = JJ
 
 
 def synsets(word, pos=NOUN):
@@ -131,6 +204,7 @@ def synsets(word, pos=NOUN):
         each of which is part of a set of synonyms (= Synset).
     """
     word, pos = normalize(word), pos.lower()
+    wn = _wordnet()
     try:
         if pos.startswith(NOUN.lower()): # "NNS" or "nn" will also pass.
             w = wn.synsets(word, pos = wn.NOUN)
@@ -142,7 +216,7 @@ def synsets(word, pos=NOUN):
             w = wn.synsets(word, pos = wn.ADV)
         else:
             raise TypeError("part of speech must be NOUN, VERB, ADJECTIVE or ADVERB, not %s" % repr(pos))
-        return [Synset(synset) for synset in w]
+        return [_intern(synset) for synset in w]
     except KeyError:
         return []
     return []
@@ -153,7 +227,7 @@ class _synset(lazydict):
     def __getitem__(self, k):
         for pos in ("n", "v", "a", "r"):
             try:
-                synset = wn._synset_from_pos_and_offset(pos, k)
+                synset = _wordnet()._synset_from_pos_and_offset(pos, k)
             except:
                 pass
             if synset:
@@ -166,6 +240,7 @@ class Synset(object):
     def __init__(self, synset):
         """ A set of synonyms that share a common meaning.
         """
+        wn = _wordnet()
         if isinstance(synset, WordNetSynset):
             self._wnsynset = synset
         elif isinstance(synset, Synset):
@@ -205,15 +280,7 @@ class Synset(object):
     def pos(self):
         """ Yields the part-of-speech tag (NOUN, VERB, ADJECTIVE or ADVERB).
         """
-        pos = self._wnsynset.pos()
-        if pos == wn.NOUN:
-            return NOUN
-        if pos == wn.VERB:
-            return VERB
-        if pos == wn.ADJ or pos == wn.ADJ_SAT:
-            return ADJECTIVE
-        if pos == wn.ADV:
-            return ADVERB
+        return _wordnet2pattern.get(self._wnsynset.pos())
 
     part_of_speech = tag = pos
 
@@ -243,7 +310,7 @@ class Synset(object):
         """ Yields the semantically opposite synset, for example:
             synsets("death")[0].antonym => Synset("birth").
         """
-        p = [Synset(a.synset()) for l in self._wnsynset.lemmas() for a in l.antonyms()]
+        p = [_intern(a.synset()) for l in self._wnsynset.lemmas() for a in l.antonyms()]
         return len(p) > 0 and p or None
 
     def meronyms(self):
@@ -256,7 +323,7 @@ class Synset(object):
         """
         p = self._wnsynset.member_meronyms()
         p += self._wnsynset.part_meronyms()
-        return [Synset(p) for p in p]
+        return [_intern(p) for p in p]
 
     def holonyms(self):
         """ Yields a list of synsets of which this synset is a member/part, for example:
@@ -264,7 +331,7 @@ class Synset(object):
         """
         p = self._wnsynset.member_holonyms()
         p += self._wnsynset.part_holonyms()
-        return [Synset(p) for p in p]
+        return [_intern(p) for p in p]
 
     def hyponyms(self, recursive=False, depth=None):
         """ Yields a list of semantically more specific synsets, for example:
@@ -279,7 +346,7 @@ class Synset(object):
              Synset("subway train")
             ]
         """
-        p = [Synset(p) for p in self._wnsynset.hyponyms()]
+        p = [_intern(p) for p in self._wnsynset.hyponyms()]
         if depth is None and recursive is False:
             return p
         if depth == 0:
@@ -293,7 +360,9 @@ class Synset(object):
     def hypernyms(self, recursive=False, depth=None):
         """ Yields a list of semantically broader synsets.
         """
-        p = [Synset(p) for p in self._wnsynset.hypernyms()]
+        if recursive is True and depth is None:
+            return [_intern(p) for p in _graph.hypernyms(self._wnsynset)]
+        p = [_intern(p) for p in self._wnsynset.hypernyms()]
         if depth is None and recursive is False:
             return p
         if depth == 0:
@@ -318,8 +387,8 @@ class Synset(object):
         """
         # ALSO_SEE returns wn.Sense instead of wn.Synset in some cases:
         #s = lambda x: isinstance(x, wn.Sense) and x.synset or x
-        p = [Synset(p) for p in self._wnsynset.similar_tos()]
-        p += [Synset(p) for p in self._wnsynset.also_sees()]
+        p = [_intern(p) for p in self._wnsynset.similar_tos()]
+        p += [_intern(p) for p in self._wnsynset.also_sees()]
         return p
 
     def similarity(self, synset):
@@ -328,13 +397,18 @@ class Synset(object):
             synsets("cat")[0].similarity(synsets("box")[0]) => 0.17.
         """
 
-        return self._wnsynset.lin_similarity(synset._wnsynset, IC_CORPUS)
+        s1, s2 = self._wnsynset, synset._wnsynset
+        if s1.pos() == s2.pos() and s1.pos() in _ic():
+            return _graph.similarity(s1, s2)
+        # Raises WordNetError.
+        return s1.lin_similarity(s2, _ic())
 
     @property
     def ic(self):
         offset, pos = self.id, self.pos
         if pos in _pattern2wordnet:
             pos = _pattern2wordnet[pos]
+        IC_CORPUS = _ic()
         if pos in IC_CORPUS and offset in IC_CORPUS[pos]:
             return IC_CORPUS[pos][offset] / IC_MAX[pos]
         return None
@@ -356,13 +430,180 @@ def ancestor(synset1, synset2):
     """ Returns the common ancestor of both synsets.
         For example synsets("cat")[0].ancestor(synsets("dog")[0]) => Synset("carnivore")
     """
-    h1, h2 = synset1.hypernyms(recursive=True), synset2.hypernyms(recursive=True)
+    h1 = _graph.hypernyms(synset1._wnsynset)
+    h2 = set(_graph.hypernyms(synset2._wnsynset))
     for s in h1:
         if s in h2:
-            return s
+            return _intern(s)
 
 least_common_subsumer = lcs = ancestor
 
+
+def similarity_matrix(words1, words2, pos=NOUN):
+    """ Returns a list of rows with the semantic similarity (0.0-1.0)
+        of each word in the first list to each word in the second list,
+        using the first sense of each word (or the given Synset objects).
+        Words that are unknown or have a different part-of-speech yield 0.0.
+    """
+    def first_sense(w):
+        if isinstance(w, Synset):
+            return w._wnsynset
+        w = synsets(w, pos)
+        return w and w[0]._wnsynset or None
+    S1 = [first_sense(w) for w in words1]
+    S2 = [first_sense(w) for w in words2]
+    return _graph.similarity_matrix(S1, S2)
+
+### SYNSET GRAPH ##################################################################################
+# Synset objects are interned, so synsets("cat")[0] is synsets("cat")[0].
+# The hypernym graph is cached with integer ids (WordNet offsets are only unique per part-of-speech),
+# so that similarity() and ancestor() look up cached ancestor sets instead of walking NLTK objects.
+# The graph is filled as synsets are first queried, since most applications use a small part of it.
+
+_interned = {}
+
+
+def _intern(synset):
+    """ Returns the (cached) Synset for the given NLTK synset.
+    """
+    try:
+        return _interned[synset]
+    except KeyError:
+        s = _interned[synset] = Synset(synset)
+        return s
+
+
+class SynsetGraph(object):
+
+    def __init__(self):
+        """ A cache of the WordNet hypernym graph, where each synset has an integer id,
+            a tuple of (recursive) hypernym ids, a set of ancestor ids and an IC-value.
+        """
+        self.id = {}            # NLTK synset => int
+        self.synsets = []       # int => NLTK synset
+        self._hypernyms = []    # int => tuple of ids, in the order of Synset.hypernyms(recursive=True)
+        self._ancestors = []    # int => frozenset of ids, including the synset and instance hypernyms
+        self._ic = []           # int => information content
+
+    def clear(self):
+        self.__init__()
+
+    def __len__(self):
+        return len(self.synsets)
+
+    def index(self, synset):
+        """ Returns the integer id for the given NLTK synset.
+        """
+        try:
+            return self.id[synset]
+        except KeyError:
+            i = self.id[synset] = len(self.synsets)
+            self.synsets.append(synset)
+            self._hypernyms.append(None)
+            self._ancestors.append(None)
+            self._ic.append(None)
+            return i
+
+    def _h(self, i, visited=()):
+        # A few verbs have cyclic hypernyms (e.g., restrain => inhibit => restrain).
+        if self._hypernyms[i] is None:
+            p = [self.index(s) for s in self.synsets[i].hypernyms()]
+            h = list(p)
+            for j in p:
+                if j not in visited:
+                    h.extend(self._h(j, visited + (i,)))
+            if visited:
+                return tuple(h)
+            self._hypernyms[i] = tuple(h)
+        return self._hypernyms[i]
+
+    def _a(self, i):
+        if self._ancestors[i] is None:
+            a = set((i,))
+            q = [i]
+            while q:
+                s = self.synsets[q.pop()]
+                for s in s.hypernyms() + s.instance_hypernyms():
+                    j = self.index(s)
+                    if j not in a:
+                        if self._ancestors[j] is not None:
+                            a.update(self._ancestors[j])
+                        else:
+                            a.add(j)
+                            q.append(j)
+            self._ancestors[i] = frozenset(a)
+        return self._ancestors[i]
+
+    def _information_content(self, i):
+        if self._ic[i] is None:
+            from nltk.corpus.reader.wordnet import information_content
+            self._ic[i] = information_content(self.synsets[i], _ic())
+        return self._ic[i]
+
+    def hypernyms(self, synset):
+        """ Returns the list of (recursive) hypernyms of the given NLTK synset.
+        """
+        return [self.synsets[j] for j in self._h(self.index(synset))]
+
+    def ancestors(self, synset):
+        """ Returns the set of ids of the given NLTK synset and its (instance) hypernyms.
+        """
+        return self._a(self.index(synset))
+
+    def similarity(self, synset1, synset2):
+        """ Returns the Lin similarity of the given NLTK synsets (same as Synset.lin_similarity()),
+            based on the information content of their most informative common ancestor.
+        """
+        i1 = self.index(synset1)
+        i2 = self.index(synset2)
+        ic = self._information_content
+        a = self._a(i1) & self._a(i2)
+        a = a and max(ic(j) for j in a) or 0
+        return (2.0 * a) / (ic(i1) + ic(i2))
+
+    def similarity_matrix(self, synsets1, synsets2):
+        """ Returns a list of rows with the Lin similarity of each NLTK synset in the first list
+            to each NLTK synset in the second list (0.0 for None or a different part-of-speech).
+        """
+        IC = _ic()
+        ic = self._information_content
+        m = {}
+        for s in synsets1:
+            if s is not None and s.pos() in IC:
+                m.setdefault(s.pos(), set()).update(self.ancestors(s))
+        # For each part-of-speech, the ancestors of the synsets in the first list,
+        # sorted by information content, are encoded as bits in a bitset (int).
+        # The lowest bit shared by two bitsets is their most informative common ancestor.
+        bits = {}
+        for pos, a in m.items():
+            a = sorted(a, key=ic, reverse=True)
+            b = bits[pos] = ({}, [ic(j) for j in a])
+            for k, j in enumerate(a):
+                b[0][j] = 1 << k
+        def bitset(s):
+            if s is None or s.pos() not in bits:
+                return 0
+            b = bits[s.pos()][0]
+            return sum(b.get(j, 0) for j in self.ancestors(s))
+        B1 = [bitset(s) for s in synsets1]
+        B2 = [bitset(s) for s in synsets2]
+        C1 = [b and ic(self.index(s)) for s, b in zip(synsets1, B1)]
+        C2 = [b and ic(self.index(s)) for s, b in zip(synsets2, B2)]
+        M = []
+        for s1, b1, c1 in zip(synsets1, B1, C1):
+            row = []
+            for s2, b2, c2 in zip(synsets2, B2, C2):
+                b = b1 & b2
+                if b and s1.pos() == s2.pos():
+                    b = bits[s1.pos()][1][(b & -b).bit_length() - 1]
+                    row.append((2.0 * b) / (c1 + c2))
+                else:
+                    row.append(0.0)
+            M.append(row)
+        return M
+
+_graph = SynsetGraph()
+
 ### INFORMATION CONTENT ############################################################################
 # Information Content (IC) is used to calculate semantic similarity in Synset.similarity().
 # Information Content values for each synset are derived from word frequency in a given corpus.
@@ -452,7 +693,7 @@ class SentiWordNet(Sentiment):
         if pos in _pattern2wordnet:
             pos = _pattern2wordnet[pos]
         try:
-            s = wn._synset_from_pos_and_offset(pos, id)
+            s = _wordnet()._synset_from_pos_and_offset(pos, id)
             lemma = s.lemma_names()[0]
             return self[lemma]
         except:
@@ -463,7 +704,7 @@ class SentiWordNet(Sentiment):
     # Words are stored without diacritics,
     # use wordnet.normalize(word).
     def __getitem__(self, k):
-        synsets = list(swn.senti_synsets(k))
+        synsets = list(_sentiwordnet().senti_synsets(k))
         if synsets:
             p, n = synsets[0].pos_score(), synsets[0].neg_score()
             v = (float(p) - float(n), float(p) + float(n))
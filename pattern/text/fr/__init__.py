@@ -28,8 +28,8 @@ sys.path.insert(0, os.path.join(MODULE, "..", "..", "..", ".."))
 
 # Import parser base classes.
 from pattern.text import (
-    Lexicon, Model, Morphology, Context, Parser as _Parser, ngrams, pprint, commandline,
-    PUNCTUATION
+    Lexicon, Model, Morphology, Context, Parser as _Parser, ngrams, iter_ngrams, count_ngrams,
+    pprint, commandline, PUNCTUATION
 )
 # Import parser universal tagset.
 from pattern.text import (
@@ -251,6 +251,16 @@ def keywords(s, top=10, **kwargs):
            "ignore": ("rt",)}, **kwargs))
 
 
+def keywords_many(documents, top=10, **kwargs):
+    """ Returns an iterator of (id, keywords)-tuples for the given list of strings.
+    """
+    return parser.find_keywords_many(documents, **dict({
+        "frequency": parser.frequency,
+              "top": top,
+              "pos": ("NN",),
+           "ignore": ("rt",)}, **kwargs))
+
+
 def suggest(w):
     """ Returns a list of (word, confidence)-tuples of spelling corrections.
     """
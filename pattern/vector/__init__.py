@@ -54,7 +54,7 @@ import types
 
 from math import log, exp, sqrt, tanh
 from time import time
-from random import random, randint, uniform, choice, sample, seed
+from random import random, randint, uniform, choice, sample, seed, getstate, setstate
 from itertools import chain
 from bisect import insort
 from operator import itemgetter
@@ -85,7 +85,7 @@ except:
                                     re.split(r"(.*?[\.|\?|\!])",
                                         re.sub(r"(\.|\?|\!|,|;|:)", " \\1", s))))
 
-from pattern.helpers import encode_string, decode_string
+from pattern.helpers import encode_string, decode_string, LRUCache, process_pool, worker_state
 
 decode_utf8 = decode_string
 encode_utf8 = encode_string
@@ -216,6 +216,10 @@ class readonlydict(dict):
     def copy(self):
         return readonlydict(self)
 
+    def __reduce__(self):
+        # Unpickled without __setitem__() (e.g., Documents in a spawned worker process).
+        return (readonlydict, (dict(self),), self.__dict__ or None)
+
     def __setitem__(self, k, v):
         raise ReadOnlyError
 
@@ -246,6 +250,9 @@ class readonlylist(list):
     def __init__(self, *args, **kwargs):
         list.__init__(self, *args, **kwargs)
 
+    def __reduce__(self):
+        return (readonlylist, (list(self),), self.__dict__ or None)
+
     def __setitem__(self, i, v):
         raise ReadOnlyError
 
@@ -505,6 +512,7 @@ class Document(object):
         self._description = kwargs.get("description", "")
         self._terms       = w                  # Dictionary of (word, count)-items.
         self._vector      = v                  # Cached tf-idf vector.
+        self._version     = None               # Model._version of the cached vector.
         self._count       = None               # Total number of words (minus stop words).
         self._model       = None               # Parent Model.
 
@@ -700,6 +708,15 @@ class Document(object):
             The document vector is used to calculate similarity between two documents,
             for example in a clustering or classification algorithm.
         """
+        if self._vector and self._model is not None and self._model._weight not in (TF, BINARY, None) \
+                        and getattr(self, "_version", None) != self._model._version:
+            # When a document is added/deleted from a model, the document frequency changes,
+            # and so does the tf-idf (IG, GR) of each document (recalculated when needed).
+            self._vector = None
+        if not self._vector and getattr(self.model, "backend", DICT) == CSR and not self.model.lsa \
+                            and self.id in self.model.matrix.rows:
+            # With Model(backend=CSR), the vector is a view of the document's row in Model.matrix.
+            self._vector = self.model.matrix.vector(self)
         if not self._vector:
             # See the Vector class below = a dict with extra functionality (copy, norm).
             # When a document is added/deleted from a model, the cached vector is deleted.
@@ -717,6 +734,7 @@ class Document(object):
             if w in (GR, GAINRATIO):
                 f = self.model.gr
             self._vector = Vector(((w, f(w)) for w in self.terms), weight=w)
+        self._version = getattr(self._model, "_version", None)
         return self._vector
 
     @property
@@ -986,30 +1004,40 @@ KMEANS, HIERARCHICAL = "k-means", "hierarchical"
 # Resampling methods:
 MINORITY, MAJORITY = "minority", "majority"
 
+# Storage backends:
+DICT, CSR = "dict", "csr"
+
 
 class Model(object):
 
-    def __init__(self, documents=[], weight=TFIDF):
+    def __init__(self, documents=[], weight=TFIDF, backend=DICT, cache=100000):
         """ A model is a bag-of-word representation of a corpus of documents, 
             where each document vector is a bag of (word, relevance)-items.
             Vectors can then be compared for similarity using a distance metric.
             The weighting scheme can be: relative TF, TFIDF (default), IG, BINARY, None,
             where None means that the original weights are used.
+            With backend=CSR, the document vectors are stored in a sparse matrix (see Matrix),
+            which is faster for large models.
+            The cosine similarity of at most the given number of pairs of documents is cached.
         """
         self.description = ""             # Description of the dataset: author e-mail, etc.
         self._documents  = readonlylist() # List of documents (read-only).
         self._index      = {}             # Document.name => Document.
-        self._df         = {}             # Cache of document frequency per word.
-        self._cos        = {}             # Cache of ((d1.id, d2.id), relevance)-items (cosine similarity).
+        self._df         = {}             # Cache of number of documents per word.
+        self._cos        = LRUCache(cache) # Cache of ({d1.id, d2.id}, relevance)-items (cosine similarity).
         self._pp         = {}             # Cache of ((word, type), probability)-items.
         self._x2         = {}             # Cache of (word, chi-squared p-value)-items.
         self._ig         = {}             # Cache of (word, information gain)-items.
         self._gr         = {}             # Cache of (word, information gain ratio)-items.
         self._inverted   = {}             # Cache of word => Document.
+        self._postings   = None           # Cache of word => [(weight, i), ...] (see Model._post()).
         self._vector     = None           # Cache of model vector with all the features in the model.
         self._classifier = None           # Classifier trained on the documents in the model (NB, KNN, SVM).
         self._lsa        = None           # LSA matrix with reduced dimensionality.
         self._weight     = weight         # Weight used in Document.vector (TF, TFIDF, IG, BINARY or None).
+        self._backend    = backend        # Storage of document vectors (DICT or CSR).
+        self._matrix     = None           # Cache of Matrix (backend=CSR).
+        self._version    = 0              # Incremented when documents are added or removed.
         self._update()
         self.extend(documents)
 
@@ -1060,11 +1088,37 @@ class Model(object):
 
     weight = property(_get_weight, _set_weight)
 
+    def _get_backend(self):
+        return getattr(self, "_backend", DICT) # Models pickled with Pattern 3.6-.
+
+    def _set_backend(self, v):
+        self._update() # Clear the cache.
+        self._backend = v
+
+    backend = property(_get_backend, _set_backend)
+
+    @property
+    def matrix(self):
+        """ Yields a Matrix of document vectors (rows) and features (columns).
+            With backend=CSR, it is cached (until a document is added or removed).
+        """
+        m = getattr(self, "_matrix", None)
+        if m is None:
+            m = Matrix(self)
+        if self.backend == CSR:
+            self._matrix = m
+        return m
+
     @classmethod
     def load(cls, path):
         """ Loads the model from a gzipped pickle file created with Model.save().
         """
         model = pickle.loads(gzip.GzipFile(path, "rb").read())
+        # Models pickled with Pattern 3.6- cache document frequency (not counts).
+        if not hasattr(model, "_version"):
+            model._version = 0
+            model._df = {}
+            model._cos = LRUCache(max(len(model._cos), 100000))
         # Deserialize Model.classifier.
         if model.classifier:
             p = path + ".tmp"
@@ -1138,18 +1192,66 @@ class Model(object):
         # Ensures that all document vectors are recalculated
         # when a document is added or deleted (= new features).
         self._df = {}
-        self._cos = {}
+        self._cos.clear()
         self._pp = {}
         self._x2 = {}
         self._ig = {}
         self._gr = {}
         self._inverted = {}
+        self._postings = None
         self._vector = None
         self._classifier = None
         self._lsa = None
+        self._matrix = None
         for document in self.documents:
             document._vector = None
 
+    def _delta(self, documents, n=+1):
+        """ Updates the cache when the given documents are added (n=+1) or removed (n=-1).
+        """
+        # The document frequency, inverted index and model vector are updated (if cached).
+        # Document vectors with tf-idf (IG, GR) weights are recalculated when needed (Model._version).
+        # With TF, BINARY or None weights, document vectors and cosine similarity stay the same,
+        # except for removed documents.
+        df, inverted, vector = self._df, self._inverted, self._vector
+        for d in documents:
+            for w, f in d.terms.items():
+                if df and f != 0:
+                    df[w] = df.get(w, 0) + n
+                    if df[w] == 0:
+                        del df[w]
+                if inverted and n > 0:
+                    inverted.setdefault(w, set()).add(d)
+                if inverted and n < 0 and w in inverted:
+                    inverted[w].discard(d)
+                    if not inverted[w]:
+                        del inverted[w]
+                        if vector is not None:
+                            dict.__delitem__(vector, w)
+                if vector is not None and n > 0 and w not in vector:
+                    dict.__setitem__(vector, w, 0.0)
+        if n < 0 and not inverted:
+            self._vector = None
+        self._version += 1
+        self._pp = {}
+        self._x2 = {}
+        self._ig = {}
+        self._gr = {}
+        self._matrix = None
+        self._classifier = None # Trained on the old documents.
+        self._lsa = None
+        if self._weight not in (TF, BINARY, None):
+            self._cos.clear()
+            self._postings = None
+        elif n < 0:
+            ids = set(d.id for d in documents)
+            for k in self._cos.keys():
+                if not ids.isdisjoint(k):
+                    self._cos.pop(k)
+            self._postings = None
+        elif self._postings is not None:
+            self._post(documents, len(self.documents) - len(documents))
+
     def __len__(self):
         return len(self.documents)
 
@@ -1163,10 +1265,11 @@ class Model(object):
         d = list.pop(self.documents, i)
         d._model = None
         self._index.pop(d.name, None)
-        self._update()
+        self._delta([d], -1)
 
     def clear(self):
         self._documents = readonlylist()
+        self._index = {}
         self._update()
 
     def append(self, document):
@@ -1180,8 +1283,7 @@ class Model(object):
             self._index[document.name] = document
         document._model = self
         list.append(self.documents, document)
-        if self._weight not in (TF, BINARY, None):
-            self._update()
+        self._delta([document], +1)
 
     def extend(self, documents):
         """ Extends the model with the given list of documents.
@@ -1194,8 +1296,7 @@ class Model(object):
                 self._index[document.name] = document
             document._model = self
         list.extend(self.documents, documents)
-        if self._weight not in (TF, BINARY, None):
-            self._update()
+        self._delta(documents, +1)
 
     def remove(self, document):
         """ Removes the given Document from the model, and sets Document.model=None.
@@ -1215,8 +1316,8 @@ class Model(object):
             With normalized=True, weights are normalized between 0.0 and 1.0 (their sum will be 1.0).
         """
         self.df(None) # Populate document frequency cache.
-        n = normalized and sum(self._df.values()) or 1.0
-        v = ((f / n, w) for w, f in self._df.items())
+        n = normalized and sum(self._df.values()) or len(self.documents)
+        v = ((float(f) / n, w) for w, f in self._df.items())
         v = heapq.nsmallest(top, v, key=lambda v: (-v[0], v[1]))
         return v
 
@@ -1228,17 +1329,18 @@ class Model(object):
         """
         if len(self.documents) == 0:
             return 0.0
+        if len(self._df) == 0 and self.backend == CSR:
+            self._df = self.matrix.dc
         if len(self._df) == 0:
             # Caching document frequency for each word gives a 300x performance boost
             # (i.e., calculated all at once). Drawback is if you need it for just one word.
+            # The number of documents per word is updated when documents are added or removed.
             df = self._df
             for d in self.documents:
                 for w, f in d.terms.items():
                     if f != 0:
-                        df[w] = (w in df) and df[w] + 1 or 1.0
-            for w in df:
-                df[w] /= float(len(self.documents))
-        return self._df.get(word, 0.0)
+                        df[w] = df.get(w, 0) + 1
+        return self._df.get(word, 0) / float(len(self.documents))
 
     df = document_frequency
 
@@ -1324,10 +1426,10 @@ class Model(object):
         # it is available in cache for reuse.
         id1 = document1.id
         id2 = document2.id
-        if (id1, id2) in self._cos:
-            return self._cos[(id1, id2)]
-        if (id2, id1) in self._cos:
-            return self._cos[(id2, id1)]
+        k = frozenset((id1, id2)) # Unordered, ids can be of different types.
+        s = self._cos.get(k)
+        if s is not None:
+            return s
         # Calculate the matrix multiplication of the document vectors.
         if not getattr(self, "lsa", None):
             v1 = document1.vector
@@ -1341,24 +1443,122 @@ class Model(object):
         # Cache the similarity weight for reuse.
         if document1.model == self and \
            document2.model == self:
-            self._cos[(id1, id2)] = s
+            self._cos[k] = s
         return s
 
     similarity = cos = cosine_similarity
 
+    @property
+    def cache(self):
+        """ Yields the LRUCache of cosine similarity, with a maximum size (number of pairs),
+            an optional memory budget in bytes (Model.cache.memory) and hit/miss statistics.
+        """
+        return self._cos
+
     def nearest_neighbors(self, document, top=10):
         """ Returns a list of (similarity, document)-tuples in the model, 
             sorted by cosine similarity to the given document.
         """
+        if self.backend == CSR and not self.lsa:
+            return self.matrix.nearest_neighbors(document, top)
+        if not self.lsa and top is not None:
+            # Only the documents that share a feature with the given document are scored.
+            v = self._shortlist(document, top)
+            v = ((self.cosine_similarity(document, self.documents[i]), i) for i in v)
+            v = [(w, i) for w, i in v if w > 0]
+            v = sorted(v, key=lambda v: (-v[0], v[1]))[:top]
+            return [(w, self.documents[i]) for w, i in v]
         v = ((self.cosine_similarity(document, d), d) for d in self.documents)
         # Filter the input document from the matches.
         # Filter documents that score zero, and return the top.
         v = [(w, d) for w, d in v if w > 0 and d.id != document.id]
-        v = heapq.nsmallest(top, v, key=lambda v: (-v[0], v[1]))
+        v = heapq.nsmallest(top, v, key=lambda v: -v[0]) # Ties in model order.
         return v
 
+    def _post(self, documents, i=0):
+        """ Adds the given documents (at index i in the model) to the inverted index of _shortlist().
+        """
+        p, m, x, n, dirty = self._postings[:5]
+        for i, d in enumerate(documents, i):
+            x[d.id] = i
+            v = d.vector
+            n.append(l2_norm(v) or 1)
+            for f, w in v.items():
+                if w != 0:
+                    w /= n[i]
+                    p.setdefault(f, []).append((w, i))
+                    m[f] = max(m.get(f, w), w)
+                    dirty.add(f)
+                    if w < 0:
+                        self._postings[5] = True
+
+    def _shortlist(self, document, top=10):
+        """ Returns the indices of the documents in the model that can be in the top
+            most similar to the given document (i.e., a short list for nearest_neighbors()).
+        """
+        # The postings of each feature are (weight / norm, i)-tuples, with i the document index,
+        # sorted by weight. Term-at-a-time, the cosine similarity is accumulated for documents
+        # that share a feature, taking features with the highest possible contribution first (max-score).
+        # A document for which score + the upper bound of the remaining features < the current top
+        # can no longer make it to the top: it is not added to the scores, or removed.
+        if self._postings is None:
+            self._postings = [{}, {}, {}, [], set(), False]
+            self._post(self.documents)
+        p, m, x, n, dirty, negative = self._postings
+        for f in dirty:
+            p[f].sort(reverse=True)
+        dirty.clear()
+        v = document.vector
+        q = sorted(((w / (l2_norm(v) or 1), f) for f, w in v.items() if w != 0 and f in p),
+            key=lambda q: -q[0] * m[q[1]])
+        # Upper bound of the score that the remaining features can add.
+        ub = [0.0]
+        for w, f in reversed(q):
+            ub.append(ub[-1] + w * m[f])
+        ub.reverse()
+        # With negative weights, partial scores are not a lower bound (no pruning).
+        if negative or any(w < 0 for w, f in q):
+            ub = [float("inf")] * len(ub)
+        i0 = x.get(document.id)
+        s = {}
+        t = float("-inf") # Current top score (k-th best), minus a margin for rounding and ties.
+        for j, (wq, f) in enumerate(q):
+            P = p[f]
+            k = len(P)
+            for k, (w, i) in enumerate(P):
+                if i in s:
+                    s[i] += wq * w
+                elif wq * w + ub[j + 1] < t:
+                    break
+                elif i != i0:
+                    s[i] = wq * w
+            else:
+                k = len(P)
+            if k < len(P):
+                # The remaining postings (lower weight) only update the existing scores.
+                if len(P) - k < len(s):
+                    for w, i in P[k:]:
+                        if i in s:
+                            s[i] += wq * w
+                else:
+                    updated = set(i for w, i in P[:k])
+                    for i in s:
+                        if i not in updated:
+                            s[i] += wq * self.documents[i].vector.get(f, 0) / n[i]
+            if len(s) >= top:
+                t = heapq.nlargest(top, s.values())[-1] - 1e-9
+                if len(s) > top:
+                    s = dict((i, w) for i, w in s.items() if w + ub[j + 1] >= t)
+        return sorted(i for i, w in s.items() if w >= t)
+
     similar = related = neighbors = nn = nearest_neighbors
 
+    def similarity_matrix(self):
+        """ Returns the cosine similarity of each pair of documents in the model,
+            as a scipy.sparse.csr_matrix with a row and a column for each document in Model.documents.
+        """
+        return self.matrix.similarity()
+
     def vector_space_search(self, words=[], **kwargs):
         """ Returns related documents from the model as a list of (similarity, document)-tuples.
             The given words can be a string (one word), a list or tuple of words, or a Document.
@@ -1428,7 +1628,7 @@ class Model(object):
             The reduction can be undone by setting Model.lsa=False.
         """
         self._lsa = LSA(self, k=dimensions)
-        self._cos = {}
+        self._cos.clear()
         return self._lsa
 
     reduce = latent_semantic_analysis
@@ -1705,6 +1905,129 @@ class Model(object):
 # Backwards compatibility.
 Corpus = Model
 
+#--- MODEL MATRIX ----------------------------------------------------------------------------------
+# Model(backend=CSR) stores the document vectors as rows in a scipy.sparse.csr_matrix,
+# with a column for each feature. Document frequency, feature weights and L2-norms are
+# then calculated for all documents at once, and so is the cosine similarity of a document
+# to all documents (Model.nearest_neighbors(), Model.search()) or of all pairs of documents.
+# Document.vector is still a Vector (dict), created from the document's row on demand.
+
+
+class Matrix(object):
+
+    def __init__(self, model):
+        """ A sparse matrix of the document vectors in the given model,
+            with a row for each document and a column for each feature.
+        """
+        import scipy.sparse
+        self.features = [] # [feature1, feature2, ...]
+        self.columns  = {} # {feature: column}
+        self.rows     = {} # {Document.id: row}
+        self.model    = model
+        i, j, n = [0], [], []
+        for r, d in enumerate(model.documents):
+            self.rows[d.id] = r
+            for f, w in d.terms.items():
+                c = self.columns.get(f)
+                if c is None:
+                    c = self.columns[f] = len(self.features)
+                    self.features.append(f)
+                j.append(c)
+                n.append(w)
+            i.append(len(j))
+        m = scipy.sparse.csr_matrix(
+            (np.array(n, dtype=float), np.array(j, dtype=np.int64), np.array(i, dtype=np.int64)),
+            shape=(len(self.rows), len(self.features)))
+        # Document frequency = the number of documents with a feature / the number of documents.
+        self._dc = np.bincount(m.indices[m.data != 0], minlength=m.shape[1])
+        self._df = self._dc / float(m.shape[0] or 1)
+        # Feature weights (see Document.vector).
+        w = model.weight
+        if w in (TF, TFIDF):
+            # tf = number of occurences of the word / number of words in document.
+            m.data /= np.repeat(np.array([d.count or 1 for d in model.documents], dtype=float), np.diff(m.indptr))
+        if w == TFIDF:
+            # idf = log(1 / df), or 1 if df=0 (cf. Document.tf_idf()).
+            df = self._df[m.indices]
+            m.data *= np.where(df > 0, np.log(1.0 / np.where(df > 0, df, 1)) / log(2.71828), 1)
+        if w == BINARY:
+            m.data = (m.data > 0).astype(float)
+        if w in (IG, INFOGAIN, GR, GAINRATIO):
+            f = w in (IG, INFOGAIN) and model.ig or model.gr
+            m.data = np.array([f(x) for x in self.features], dtype=float)[m.indices]
+        self.weight = w in (TF, TFIDF, IG, INFOGAIN, GR, GAINRATIO, BINARY) and w or None
+        self.matrix = m
+        self.norms = np.sqrt(np.asarray(m.multiply(m).sum(axis=1)).ravel())
+        self._inverted = None # Feature x document matrix.
+
+    @property
+    def shape(self):
+        return self.matrix.shape
+
+    @property
+    def df(self):
+        """ Yields a dictionary of (feature, document frequency)-items.
+        """
+        return dict((f, df) for f, df in zip(self.features, self._df.tolist()) if df > 0)
+
+    @property
+    def dc(self):
+        """ Yields a dictionary of (feature, number of documents)-items.
+        """
+        return dict((f, n) for f, n in zip(self.features, self._dc.tolist()) if n > 0)
+
+    def vector(self, document):
+        """ Returns the Vector of the given document (i.e., its row in the matrix).
+        """
+        i = self.rows[document.id]
+        m = self.matrix
+        a, b = m.indptr[i], m.indptr[i + 1]
+        v = m.data[a:b]
+        v = v.astype(int) if self.weight == BINARY else v
+        return Vector(zip([self.features[j] for j in m.indices[a:b]], v.tolist()), weight=self.weight)
+
+    def similarities(self, document):
+        """ Returns an array with the cosine similarity of the given document to each row.
+        """
+        m = self.matrix
+        if document.id in self.rows:
+            i = self.rows[document.id]
+            a, b = m.indptr[i], m.indptr[i + 1]
+            j, v, n = m.indices[a:b], m.data[a:b], self.norms[i]
+        else:
+            # Document not in the model (e.g., Model.search()).
+            v = [(self.columns.get(f), w) for f, w in document.vector.items()]
+            v = [(j, w) for j, w in v if j is not None]
+            j = np.array([j for j, w in v], dtype=np.int64)
+            v = np.array([w for j, w in v], dtype=float)
+            n = l2_norm(document.vector)
+        if self._inverted is None:
+            self._inverted = m.T.tocsr()
+        s = self._inverted[j].T.dot(v)
+        s = s / np.where(self.norms * n == 0, 1, self.norms * n)
+        return s
+
+    def nearest_neighbors(self, document, top=10):
+        """ Returns a list of (similarity, document)-tuples, sorted by cosine similarity to the given document.
+        """
+        s = self.similarities(document)
+        if document.id in self.rows:
+            s[self.rows[document.id]] = 0
+        i = np.flatnonzero(s > 0)
+        if top is not None and len(i) > top:
+            # Keep all ties with the top-th document, sorted in model order below.
+            t = np.partition(-s[i], top - 1)[top - 1]
+            i = i[-s[i] <= t]
+        i = i[np.lexsort((i, -s[i]))][:top]
+        return [(float(s[j]), self.model.documents[j]) for j in i]
+
+    def similarity(self):
+        """ Returns a sparse matrix with the cosine similarity of each pair of rows.
+        """
+        import scipy.sparse
+        m = scipy.sparse.diags(1.0 / np.where(self.norms == 0, 1, self.norms)).dot(self.matrix)
+        return m.dot(m.T).tocsr()
+
 #### FREQUENT CONCEPT SETS #########################################################################
 # Agrawal R. & Srikant R. (1994), Fast algorithms for mining association rules in large databases.
 # Based on: https://gist.github.com/1423287
@@ -1780,16 +2103,17 @@ class LSA(object):
             Documents then get a concept vector that is an approximation of the original vector,
             but with reduced dimensionality so that cosine similarity and clustering run faster.
         """
-        # Calling Model.vector() in a loop is quite slow, we should refactor this:
-        matrix = [list(model.vector(d).values()) for d in model.documents]
-        matrix = np.array(matrix)
-        # Singular value decomposition, where u * sigma * vt = svd(matrix).
-        # Sigma is the diagonal matrix of singular values,
-        # u has document rows and concept columns, vt has concept rows and term columns.
-        u, sigma, vt = np.linalg.svd(matrix, full_matrices=False)
-
-        # Note: now np.dot(np.dot(u, np.diag(sigma)), vt) !≈ matrix
-        # assert np.allclose(np.dot(np.dot(u, np.diag(sigma)), vt), matrix)
+        import scipy.sparse
+        import scipy.sparse.linalg
+        # The document x term matrix is built in one pass from the (sparse) document vectors,
+        # with the columns in the order of Model.vector.
+        terms = list(model.vector.keys())
+        matrix = sparse_matrix([d.vector for d in model.documents], terms)
+        n = min(matrix.shape)
+        u = sigma = vt = None
+        if k == L1 or type(k).__name__ == "function":
+            # The number of dimensions depends on all the singular values (full SVD).
+            u, sigma, vt = np.linalg.svd(matrix.toarray(), full_matrices=False)
 
         # Delete the smallest coefficients in the diagonal matrix (i.e., at the end of the list).
         # The difficulty and weakness of LSA is knowing how many dimensions to reduce
@@ -1797,36 +2121,53 @@ class LSA(object):
         if k == L1:
             k = int(round(np.linalg.norm(sigma, 1)))
         if k == L2 or k == NORM:
-            k = int(round(np.linalg.norm(sigma, 2)))
+            # The L2-norm of the singular values = the Frobenius norm of the matrix.
+            k = int(round(sqrt(matrix.multiply(matrix).sum())))
         if k == TOP300:
-            k = max(0, len(sigma) - 300)
+            k = max(0, n - 300)
         if isinstance(k, int):
-            k = max(0, len(sigma) - k)
+            k = max(0, n - k)
         if type(k).__name__ == "function":
             k = max(0, int(k(sigma)))
-        #print(np.dot(u, np.dot(np.diag(sigma), vt)))
         # Apply dimension reduction.
         # The maximum length of a concept vector = the number of documents.
         assert k < len(model.documents), \
             "can't create more dimensions than there are documents"
-        tail = lambda x, i: list(range(len(x) - i, len(x)))
-        u, sigma, vt = (
-            np.delete(u, tail(u[0], k), axis=1),
-            np.delete(sigma, tail(sigma, k), axis=0),
-            np.delete(vt, tail(vt, k), axis=0)
-        )
+        k = max(0, n - k) # Number of concepts.
+
+        # Singular value decomposition, where u * sigma * vt = svd(matrix).
+        # Sigma is the diagonal matrix of singular values,
+        # u has document rows and concept columns, vt has concept rows and term columns.
+        # For a few concepts, only the largest singular values are calculated (truncated SVD).
+        if sigma is None and 0 < k < n // 2:
+            u, sigma, vt = scipy.sparse.linalg.svds(matrix, k, v0=np.random.RandomState(0).rand(n))
+            u, sigma, vt = u[:, ::-1], sigma[::-1], vt[::-1]
+        if sigma is None:
+            u, sigma, vt = np.linalg.svd(matrix.toarray(), full_matrices=False)
+        u, sigma, vt = u[:, :k], sigma[:k], vt[:k]
 
         # In some numpy versions, np.linalg.svd seems to yield negative components. SVD decomposition is not unique.
         u, sigma, vt = list(map(np.abs, (u, sigma, vt)))
 
-        # Store as Python dict and lists so we can pickle it.
         self.model = model
-        self._terms = dict(enumerate(model.vector().keys())) # Vt-index => word.
-        self.u, self.sigma, self.vt = (
-            dict((d.id, Vector((i, float(x)) for i, x in enumerate(v))) for d, v in zip(model, u)),
-            list(sigma),
-            [[float(x) for x in v] for v in vt]
-        )
+        self._terms = dict(enumerate(terms)) # Vt-index => word.
+        self._rows = dict((d.id, i) for i, d in enumerate(model.documents)) # Document.id => u-index.
+        self._u = u
+        self._vectors = {}                   # Cache of Document.id => Vector.
+        self.sigma = sigma
+        self.vt = vt
+
+    def __setstate__(self, state):
+        # LSA pickled with Pattern 3.6- (Python dict and lists).
+        if "u" in state:
+            u = state.pop("u")
+            k = len(state["sigma"])
+            state["_rows"] = dict((id, i) for i, id in enumerate(u))
+            state["_u"] = np.array([[u[id].get(j, 0.0) for j in range(k)] for id in u]).reshape(len(u), k)
+            state["_vectors"] = u
+            state["sigma"] = np.array(state["sigma"])
+            state["vt"] = np.array(state["vt"]).reshape(k, len(state["_terms"]))
+        self.__dict__.update(state)
 
     @property
     def terms(self):
@@ -1841,7 +2182,14 @@ class LSA(object):
         """ Yields a list of all concepts, each a dictionary of (word, weight)-items.
         """
         # Round the weight so 9.0649330400000009e-17 becomes a more meaningful 0.0.
-        return [dict((self._terms[i], round(w, 15)) for i, w in enumerate(concept)) for concept in self.vt]
+        return [dict((self._terms[i], round(w, 15)) for i, w in enumerate(concept)) for concept in self.vt.tolist()]
+
+    @property
+    def u(self):
+        """ Yields a dictionary of (Document.id, Vector)-items,
+            where each vector is a dictionary of (concept_index, weight)-items.
+        """
+        return dict((id, self.vector(id)) for id in self._rows)
 
     @property
     def vectors(self):
@@ -1856,35 +2204,61 @@ class LSA(object):
     def vector(self, id):
         if isinstance(id, Document):
             id = id.id
-        return self.u[id]
+        if id not in self._vectors:
+            self._vectors[id] = Vector(enumerate(self._u[self._rows[id]].tolist()))
+        return self._vectors[id]
 
     def __getitem__(self, id):
-        return self.u[id]
+        return self.vector(id)
 
     def __contains__(self, id):
-        return id in self.u
+        return id in self._rows
 
     def __iter__(self):
-        return iter(self.u)
+        return iter(self._rows)
 
     def __len__(self):
-        return len(self.u)
+        return len(self._rows)
 
     def transform(self, document):
         """ Given a document not in the model, returns a vector in LSA concept space.
             This happes automatically in Model.cosine_similarity(),
             but it must be done explicitly for Classifier.classify() input.
         """
-        if document.id in self.u:
-            return self.u[document.id]
-        if document.id in _lsa_transform_cache:
-            return _lsa_transform_cache[document.id]
-        import numpy
-        v = self.model.vector(document)
-        v = [v[self._terms[i]] for i in range(len(v))]
-        v = np.dot(np.dot(np.linalg.inv(np.diag(self.sigma)), self.vt), v)
-        v = _lsa_transform_cache[document.id] = Vector(enumerate(v))
-        return v
+        return self.transform_many([document])[0]
+
+    def transform_many(self, documents):
+        """ Returns a list of vectors in LSA concept space for the given documents,
+            projected all at once (faster than calling LSA.transform() for each document).
+        """
+        import scipy.sparse
+        documents = list(documents)
+        vectors = [None] * len(documents)
+        x = [] # Indices of new documents.
+        for i, d in enumerate(documents):
+            if d.id in self._rows:
+                vectors[i] = self.vector(d.id)
+            elif d.id in _lsa_transform_cache:
+                vectors[i] = _lsa_transform_cache[d.id]
+            else:
+                x.append(i)
+        if x:
+            if getattr(self, "_columns", None) is None:
+                self._columns = dict((w, j) for j, w in self._terms.items())
+            columns = self._columns
+            r, j, v = [0], [], []
+            for i in x:
+                for f, w in documents[i].vector.items():
+                    if f in columns:
+                        j.append(columns[f])
+                        v.append(w)
+                r.append(len(j))
+            m = scipy.sparse.csr_matrix((v, j, r), shape=(len(x), len(columns)), dtype=float)
+            # v = inv(diag(sigma)) * vt * v
+            m = m.dot(self.vt.T) / np.where(self.sigma == 0, 1, self.sigma)
+            for i, v in zip(x, m):
+                vectors[i] = _lsa_transform_cache[documents[i].id] = Vector(enumerate(v.tolist()))
+        return vectors
 
 # LSA cache for Model.vector_space_search() shouldn't be stored with Model.save()
 # (so it is a global instead of a property of the LSA class).
@@ -1970,6 +2344,72 @@ class DistanceMap(object):
         return d
 
 
+def sparse_matrix(vectors=[], features=[]):
+    """ Returns the given list of vectors as a scipy.sparse.csr_matrix,
+        with a row for each vector and a column for each feature (in the given order).
+        Features in a vector that are not in the given list are ignored.
+        The features can also be given as a dict of (feature, column)-items.
+    """
+    import scipy.sparse
+    if not features:
+        features = list(_features(vectors))
+    if isinstance(features, dict):
+        columns = features
+    else:
+        columns = dict((f, j) for j, f in enumerate(features))
+    i, j, w = [0], [], []
+    for v in vectors:
+        for f, x in v.items():
+            if f in columns:
+                j.append(columns[f])
+                w.append(x)
+        i.append(len(j))
+    return scipy.sparse.csr_matrix((w, j, i), shape=(len(vectors), len(features)), dtype=float)
+
+
+def _distances(X, C, method=COSINE, norms=None):
+    """ Returns a NumPy array with the distance between each row in the sparse matrix X
+        and each row in the array C (COSINE or squared EUCLIDEAN distance).
+        The squared L2-norm of each row in X can be given for speed.
+    """
+    if norms is None:
+        norms = np.asarray(X.multiply(X).sum(axis=1)).ravel()
+    d = X.dot(C.T)
+    c = (C * C).sum(axis=1)
+    if method == COSINE:
+        n = np.outer(np.sqrt(norms), np.sqrt(c))
+        return 1 - d / np.where(n == 0, 1, n)
+    if method == EUCLIDEAN:
+        return np.maximum(norms[:, None] + c[None, :] - 2 * d, 0)
+
+
+def _nearest(X, C, method=COSINE, norms=None, batch=10000):
+    """ Returns a NumPy array with the index of the nearest row in C for each row in X,
+        and an array with the distance, calculated for batches of rows in X.
+        For vectors at the same distance of several rows in C, the first is chosen.
+    """
+    if norms is None:
+        norms = np.asarray(X.multiply(X).sum(axis=1)).ravel()
+    a, d = [], []
+    for i in range(0, X.shape[0], batch):
+        m = _distances(X[i:i + batch], C, method, norms[i:i + batch])
+        a.append(m.argmin(axis=1))
+        d.append(m[np.arange(len(a[-1])), a[-1]])
+    if not a:
+        return np.zeros(0, dtype=int), np.zeros(0)
+    return np.concatenate(a), np.concatenate(d)
+
+
+def _centroids(X, a, k):
+    """ Returns a NumPy array with the mean of the rows in the sparse matrix X for each cluster,
+        where a is an array with the cluster index for each row (the mean of an empty cluster is 0).
+    """
+    import scipy.sparse
+    n = np.bincount(a, minlength=k).astype(float)
+    M = scipy.sparse.csr_matrix((1.0 / n[a], (a, np.arange(len(a)))), shape=(k, len(a)))
+    return np.asarray(M.dot(X).todense())
+
+
 def cluster(method=KMEANS, vectors=[], **kwargs):
     """ Clusters the given list of vectors using the k-means or hierarchical algorithm.
     """
@@ -1985,18 +2425,26 @@ def cluster(method=KMEANS, vectors=[], **kwargs):
 RANDOM, KMPP = "random", "kmeans++"
 
 
-def k_means(vectors, k=None, iterations=10, distance=COSINE, seed=RANDOM, **kwargs):
+def k_means(vectors, k=None, iterations=10, distance=COSINE, seed=RANDOM, batch=None, **kwargs):
     """ Returns a list of k clusters, where each cluster is a list of vectors (Lloyd's algorithm).
         Vectors are assigned to k random centers using a distance metric (EUCLIDEAN, COSINE, ...).
         Since the initial centers are chosen randomly (by default, seed=RANDOM),
         there is no guarantee of convergence or of finding an optimal solution.
         A more efficient way is to use seed=KMPP (k-means++ initialization algorithm).
+        With batch=n, each iteration updates the centers with n random vectors (mini-batch k-means),
+        which is faster for large data sets (e.g., 100,000+ vectors) but less accurate.
     """
     features = kwargs.get("features") or _features(vectors)
     if k is None:
         k = sqrt(len(vectors) / 2)
     if k < 2:
         return [[v for v in vectors]]
+    if distance in (COSINE, EUCLIDEAN):
+        # For COSINE and EUCLIDEAN distance, the vectors are clustered as a sparse matrix,
+        # with the distance between all vectors and all centers calculated at once.
+        X = sparse_matrix(vectors, list(features))
+        a = _k_means(X, int(k), iterations, distance, seed, batch)
+        return [[vectors[i] for i in np.flatnonzero(a == j)] for j in range(int(k))]
     if seed == KMPP:
         clusters = kmpp(vectors, k, distance)
     else:
@@ -2040,6 +2488,78 @@ def k_means(vectors, k=None, iterations=10, distance=COSINE, seed=RANDOM, **kwar
 kmeans = k_means
 
 
+def _k_means(X, k, iterations=10, distance=COSINE, seed=RANDOM, batch=None):
+    """ Returns a NumPy array with the cluster index (0-k) for each row in the sparse matrix X.
+    """
+    n = X.shape[0]
+    x = np.asarray(X.multiply(X).sum(axis=1)).ravel()
+    if seed == KMPP:
+        a = _kmpp(X, k, distance, x)
+    else:
+        # Randomly partition the vectors across k clusters.
+        a = np.zeros(n, dtype=int)
+        a[sorted(range(n), key=lambda i: random())] = np.arange(n) % k
+    if batch:
+        # Mini-batch k-means (Sculley, 2010).
+        # The centers are updated with a random sample of vectors in each iteration,
+        # moving each center towards its nearest vectors with a decreasing learning rate
+        # (1 / the number of vectors assigned to it so far).
+        C = _centroids(X, a, k)
+        m = np.zeros(k)
+        for _ in range(iterations):
+            i = np.array(sample(range(n), min(int(batch), n)))
+            b = _nearest(X[i], C, distance, x[i])[0]
+            j = np.bincount(b, minlength=k).astype(float)
+            m += j
+            j = j / np.where(m == 0, 1, m)
+            C = C * (1 - j)[:, None] + _centroids(X[i], b, k) * j[:, None]
+        return _nearest(X, C, distance, x)[0]
+    for _ in range(iterations):
+        # Calculate the center of each cluster.
+        # Assign each vector to the nearest center (unless it is as near to its own center).
+        C = _centroids(X, a, k)
+        b = np.zeros(n, dtype=int)
+        for i in range(0, n, 10000):
+            D = _distances(X[i:i + 10000], C, distance, x[i:i + 10000])
+            j = D.argmin(axis=1)
+            r = np.arange(len(j))
+            b[i:i + 10000] = np.where(D[r, j] < D[r, a[i:i + 10000]], j, a[i:i + 10000])
+        if (a == b).all():
+            break
+        a = b
+    return a
+
+
+def _kmpp(X, k, distance=COSINE, norms=None):
+    """ Returns a NumPy array with the cluster index for each row in the sparse matrix X,
+        using k-means++ initialization (see kmpp()).
+    """
+    d = lambda i: _distances(X, X[i].toarray(), distance, norms)[:, 0]
+    # Choose one center at random.
+    # Calculate the distance between each vector and the nearest center.
+    centroids = [choice(range(X.shape[0]))]
+    D = d(centroids[0])
+    s = D.sum()
+    for _ in range(int(k) - 1):
+        # Choose a random number y between 0 and d1 + d2 + ... + dn.
+        # Find vector i so that: d1 + d2 + ... + di >= y > d1 + d2 + ... + dj.
+        # Perform a number of local tries so that y yields a small distance sum.
+        i = 0
+        c = np.cumsum(D)
+        for _ in range(int(2 + log(k))):
+            i1 = min(int(np.searchsorted(c, random() * s)), len(D) - 1)
+            s1 = np.minimum(D, d(i1)).sum()
+            if s1 < s:
+                s, i = s1, i1
+        # Add vector i as a new center.
+        # Repeat until we have chosen k centers.
+        centroids.append(i)
+        D = np.minimum(D, d(i))
+        s = D.sum()
+    # Assign points to the nearest center.
+    return _nearest(X, X[centroids].toarray(), distance, norms)[0]
+
+
 def kmpp(vectors, k, distance=COSINE):
     """ The k-means++ initialization algorithm returns a set of initial clusers, 
         with the advantage that:
@@ -2047,6 +2567,9 @@ def kmpp(vectors, k, distance=COSINE):
         - it runs faster than standard k-means,
         - it has a theoretical approximation guarantee.
     """
+    if distance in (COSINE, EUCLIDEAN):
+        a = _kmpp(sparse_matrix(vectors), k, distance)
+        return [[vectors[i] for i in np.flatnonzero(a == j)] for j in range(int(k))]
     # Cache the distance calculations between vectors (up to 4x faster).
     map = DistanceMap(method=distance)
     distance = map.distance
@@ -2087,6 +2610,7 @@ def kmpp(vectors, k, distance=COSINE):
 
 #--- HIERARCHICAL ----------------------------------------------------------------------------------
 # Hierarchical clustering is slow but the optimal solution guaranteed in O(len(vectors) ** 3).
+# For COSINE and EUCLIDEAN distance it runs in O(len(vectors) ** 2) (see _hierarchical()).
 
 
 class Cluster(list):
@@ -2148,6 +2672,13 @@ def hierarchical(vectors, k=1, iterations=1000, distance=COSINE, **kwargs):
     id = sequence()
     features = kwargs.get("features", _features(vectors))
     clusters = Cluster((v for v in shuffled(vectors)))
+    if distance in (COSINE, EUCLIDEAN):
+        # Clusters are merged in the same order, but without comparing all pairs of centroids.
+        a = dict(enumerate(clusters))
+        m = _hierarchical(sparse_matrix(clusters, list(features)), k, iterations, distance)
+        for n, (i, j) in enumerate(m):
+            a[len(clusters) + n] = Cluster((a.pop(i), a.pop(j)))
+        return Cluster(a[i] for i in sorted(a))
     centroids = [(next(id), v) for v in clusters]
     map = {}
     for _ in range(iterations):
@@ -2159,10 +2690,12 @@ def hierarchical(vectors, k=1, iterations=1000, distance=COSINE, **kwargs):
                 # Cache the distance calculations between vectors.
                 # This is identical to DistanceMap.distance(),
                 # but it is faster in the inner loop to use it directly.
+                # Distances are rounded, so that equal distances (e.g., duplicate vectors)
+                # are merged first-come, regardless of rounding errors.
                 try:
                     d = map[(id1, id2)]
                 except KeyError:
-                    d = map[(id1, id2)] = _distance(v1, v2, method=distance)
+                    d = map[(id1, id2)] = round(_distance(v1, v2, method=distance), 12)
                 if d0 is None or d < d0:
                     nearest, d0 = (i, j + i + 1), d
         # Pairs of nearest clusters are merged as we move up the hierarchy:
@@ -2178,6 +2711,87 @@ def hierarchical(vectors, k=1, iterations=1000, distance=COSINE, **kwargs):
         centroids.append((next(id), v))
     return clusters
 
+
+def _hierarchical(X, k=1, iterations=1000, distance=COSINE):
+    """ Returns a list of (i, j)-tuples of the clusters merged by hierarchical(),
+        for the rows in the sparse matrix X (centroid linkage, COSINE or squared EUCLIDEAN distance).
+        The rows are clusters 0, 1, 2, ..., the merged clusters are numbered len(X), len(X) + 1, ...
+    """
+    # The centroids are never calculated.
+    # The distance between two centroids is a function of the dot product of the sum of vectors
+    # in each cluster (G) and the number of vectors in each cluster (n).
+    # When two clusters are merged, the sum of vectors is the sum of their sums,
+    # so the row of dot products for the merged cluster = the sum of their rows.
+    # For each cluster, the nearest of the clusters that come after it is cached (Mullner, 2011),
+    # so that pairs are compared in the same order as hierarchical() over all pairs.
+    # Distances are rounded to 12 decimals in both, since the dot products have other rounding errors
+    # than the centroids (e.g., 1e-16 instead of 0.0 for parallel vectors), which breaks ties differently.
+    m = X.shape[0]
+    G = X.dot(X.T).toarray()
+    n = np.ones(m)
+    id = np.arange(m)                # Cluster number in each row.
+    active = np.ones(m, dtype=bool)
+    stale = np.zeros(m, dtype=bool)  # Nearest cluster was merged.
+
+    def d(i=None):
+        # Returns the distance from the cluster in row i to all other clusters.
+        g = G if i is None else G[i]
+        q = G.diagonal()
+        if distance == COSINE:
+            s = np.sqrt(q)
+            s[s == 0] = 1
+            x = 1 - g / (s[:, None] if i is None else s[i]) / s
+        if distance == EUCLIDEAN:
+            q = q / n ** 2
+            g = g / (n[:, None] if i is None else n[i]) / n
+            x = np.maximum((q[:, None] if i is None else q[i]) + q - 2 * g, 0)
+        return np.round(x, 12)
+
+    def nearest(i):
+        # Returns the row of the nearest cluster after the cluster in row i (first if equal).
+        x = d(i)
+        x[~active | (id <= id[i])] = np.inf
+        j = np.flatnonzero(x == x.min())
+        j = j[np.argmin(id[j])]
+        return j, x[j]
+
+    # The nearest cluster after each cluster.
+    x = d()
+    x[np.tril_indices(m)] = np.inf
+    nn = x.argmin(axis=1)
+    nd = x[np.arange(m), nn]
+    del x
+    merged = []
+    while len(merged) < min(iterations, m - max(k, 1)):
+        # The nearest pair of clusters (first if equal).
+        # If the nearest cluster of a row was merged, its distance is a lower bound,
+        # so the row only needs to be updated when it is the nearest.
+        i = np.flatnonzero(nd == nd.min())
+        i = i[np.argmin(id[i])]
+        if stale[i]:
+            nn[i], nd[i] = nearest(i)
+            stale[i] = False
+            continue
+        j = nn[i]
+        merged.append((id[i], id[j]))
+        # Row i is the merged cluster, row j is removed.
+        q = G[i, i] + G[j, j] + 2 * G[i, j]
+        G[i] += G[j]
+        G[:, i] = G[i]
+        G[i, i] = q
+        n[i] += n[j]
+        id[i] = m + len(merged) - 1
+        active[j] = False
+        nd[i] = nd[j] = np.inf
+        stale[i] = stale[j] = False
+        # The merged cluster comes after all others.
+        x = d(i)
+        x[i] = np.inf
+        stale |= active & ((nn == i) | (nn == j))
+        u = active & (x < nd)
+        nn[u], nd[u], stale[u] = i, x[u], False
+    return merged
+
 #from pattern.vector import Vector
 #
 #v1 = Vector(wings=0, beak=0, claws=1, paws=1, fur=1) # cat
@@ -2337,13 +2951,13 @@ class Classifier(object):
     crossvalidate = cross_validate = cv = k_fold_cross_validation
 
     @classmethod
-    def test(cls, corpus=[], d=0.65, folds=1, **kwargs):
+    def test(cls, corpus=[], d=0.65, folds=1, workers=1, **kwargs):
         # Backwards compatibility.
         # In Pattern 2.5-, Classifier.test() is a classmethod.
         # In Pattern 2.6+, it is replaced with Classifier._test() once instantiated.
         corpus = kwargs.pop("documents", kwargs.pop("train", corpus))
         if folds > 1:
-            return K_fold_cross_validation(cls, documents=corpus, folds=folds, **kwargs)
+            return K_fold_cross_validation(cls, documents=corpus, folds=folds, workers=workers, **kwargs)
         i = int(round(max(0.0, min(1.0, d)) * len(corpus)))
         d = shuffled(corpus)
         return cls(train=d[:i], **kwargs).test(d[i:])
@@ -2379,9 +2993,12 @@ class Classifier(object):
         if final:
             self.finalize()
         self.test = None # Can't pickle instancemethods.
-        f = gzip.GzipFile(path, "wb")
-        f.write(pickle.dumps(self, 1)) # 1 = binary
-        f.close()
+        try:
+            f = gzip.GzipFile(path, "wb")
+            f.write(pickle.dumps(self, 1)) # 1 = binary
+            f.close()
+        finally:
+            self.test = self._test
 
     @classmethod
     def load(cls, path):
@@ -2520,42 +3137,82 @@ class ConfusionMatrix(defaultdict):
         return repr(dict((k, dict(v)) for k, v in self.items()))
 
 
-def K_fold_cross_validation(Classifier, documents=[], folds=10, **kwargs):
+def K_fold_cross_validation(Classifier, documents=[], folds=10, workers=1, **kwargs):
     """ Returns an (accuracy, precisiom, recall, F1-score, standard deviation)-tuple.
         For 10-fold cross-validation, performs 10 separate tests of the classifier,
         each with a different 9/10 training and 1/10 testing documents.
         The given list of documents contains Documents or (document, type)-tuples.
         The given classifier is a class (NB, KNN, SLP, SVM)
         which is initialized with the given optional parameters.
+        With workers > 1, the folds are tested in a pool of processes.
     """
     K = kwargs.pop("K", folds)
     s = kwargs.pop("shuffled", True)
-    # Macro-average accuracy, precision, recall & F1-score.
-    m = [0.0, 0.0, 0.0, 0.0]
-    f = []
     # Create shuffled folds to avoid a list sorted by type
     # (we take successive folds and the source data could be sorted).
     if isinstance(K, (int, float)):
         folds = list(_folds(shuffled(documents) if s else documents, K))
+    else:
+        folds = list(K)
     # K tests with different train (d1) and test (d2) sets.
-    for d1, d2 in folds:
-        d1 = [isinstance(d, Document) and (d, d.type) or d for d in d1]
-        d2 = [isinstance(d, Document) and (d, d.type) or d for d in d2]
-        classifier = Classifier(train=d1, **kwargs)
-        A, P, R, F = classifier.test(d2, **kwargs)
+    return _cross_validation(_test_folds(Classifier, folds, [(kwargs, i) for i in range(len(folds))], workers))
+
+kfoldcv = K_fold_cv = k_fold_cv = k_fold_cross_validation = K_fold_cross_validation
+
+
+def _cross_validation(results=[]):
+    """ Returns an (accuracy, precision, recall, F1-score, standard deviation)-tuple
+        for the given list of (A, P, R, F)-tuples of each fold.
+    """
+    # Macro-average accuracy, precision, recall & F1-score.
+    m = [0.0, 0.0, 0.0, 0.0]
+    f = []
+    for A, P, R, F in results:
         m[0] += A
         m[1] += P
         m[2] += R
         m[3] += F
         f.append(F)
     # F-score mean & variance.
-    K = len(folds)
+    K = len(results)
     u = float(sum(f)) / (K or 1.0)
     o = float(sum((x - u) ** 2 for x in f)) / (K - 1 or 1.0)
     o = sqrt(o)
     return tuple([v / (K or 1.0) for v in m] + [o])
 
-kfoldcv = K_fold_cv = k_fold_cv = k_fold_cross_validation = K_fold_cross_validation
+
+def _test_folds(Classifier, folds=[], tasks=[], workers=1):
+    """ Returns a list of (A, P, R, F)-tuples for the given list of (parameters, fold)-tuples,
+        where fold is the index of a (train, test)-tuple in the given list of folds.
+        With workers > 1, the tasks are tested in a pool of processes (in the same order).
+    """
+    # Each fold is tested with its own random seed (e.g., KNN ties),
+    # so that the results are the same for any number of workers.
+    cv = (Classifier, folds, randint(0, 1000000))
+    if workers > 1 and len(tasks) > 1:
+        pool = process_pool(min(workers, len(tasks)), cv)
+        try:
+            return pool.map(_test_fold, tasks, chunksize=1)
+        finally:
+            pool.terminate()
+            pool.join()
+    r = getstate()
+    try:
+        return [_test_fold(task, cv) for task in tasks]
+    finally:
+        setstate(r)
+
+
+def _test_fold(task, cv=None):
+    # _test_folds(workers=2) worker.
+    Classifier, folds, s = cv or worker_state()
+    kwargs, i = task
+    seed(s + i)
+    d1, d2 = folds[i]
+    d1 = [isinstance(d, Document) and (d, d.type) or d for d in d1]
+    d2 = [isinstance(d, Document) and (d, d.type) or d for d in d2]
+    classifier = Classifier(train=d1, **kwargs)
+    return tuple(classifier.test(d2, **kwargs))
 
 
 def folds(documents=[], K=10, **kwargs):
@@ -2581,7 +3238,7 @@ def folds(documents=[], K=10, **kwargs):
 _folds = folds
 
 
-def gridsearch(Classifier, documents=[], folds=10, **kwargs):
+def gridsearch(Classifier, documents=[], folds=10, workers=1, stop=None, **kwargs):
     """ Returns the test results for every combination of optional parameters,
         using K-fold cross-validation for the given classifier (NB, KNN, SLP, SVM).
         For example:
@@ -2590,6 +3247,10 @@ def gridsearch(Classifier, documents=[], folds=10, **kwargs):
         > (0.919, 0.921, 0.919, 0.920), {"c": 10}
         > (0.874, 0.884, 0.865, 0.874), {"c": 1}
         > (0.535, 0.424, 0.551, 0.454), {"c": 0.1}
+        All combinations are tested on the same folds.
+        With workers > 1, the folds of all combinations are tested in a pool of processes.
+        With stop=n, combinations with a lower F1-score after n folds than the best F1-score
+        after all folds are not tested further (their results are for n folds).
     """
     def product(*args):
         # Yields the cartesian product of given iterables:
@@ -2599,15 +3260,35 @@ def gridsearch(Classifier, documents=[], folds=10, **kwargs):
             p = [x + [y] for x in p for y in iterable]
         for p in p:
             yield tuple(p)
-    s = [] # [((A, P, R, F, o), parameters), ...]
+    s = [] # [(folds, (A, P, R, F, o), parameters), ...]
     p = [] # [[("c", 0.1), ("c", 10), ...],
            #  [("gamma", 0.1), ("gamma", 0.2), ...], ...]
     for k, v in kwargs.items():
         p.append([(k, v) for v in v])
-    for p in product(*p):
-        p = dict(p)
-        s.append((K_fold_cross_validation(Classifier, documents, folds, **p), p))
-    return sorted(s, reverse=True)
+    p = [dict(p) for p in product(*p)]
+    if isinstance(folds, (int, float)):
+        folds = list(_folds(shuffled(documents), folds))
+    else:
+        folds = list(folds)
+    n = min(stop or len(folds), len(folds))
+    # Test the first n folds of all combinations.
+    r = _test_folds(Classifier, folds, [(p, i) for p in p for i in range(n)], workers)
+    r = [r[i:i + n] for i in range(0, len(r), n)]
+    # Test the other folds of the combinations with the highest F1-score first,
+    # until the F1-score after n folds is lower than the best F1-score after all folds.
+    F = lambda r: _cross_validation(r)[3]
+    m = None
+    for i in sorted(range(len(p)), key=lambda i: -F(r[i])):
+        if n == len(folds):
+            break
+        if m is not None and F(r[i]) < m:
+            break
+        r[i] += _test_folds(Classifier, folds, [(p[i], j) for j in range(n, len(folds))], workers)
+        m = F(r[i]) if m is None else max(m, F(r[i]))
+    # Combinations tested on all folds come first.
+    for p, r in zip(p, r):
+        s.append((len(r), _cross_validation(r), p))
+    return [(x[1], x[2]) for x in sorted(s, key=lambda x: x[:2], reverse=True)]
 
 
 def feature_selection(documents=[], top=None, method=CHISQUARED, threshold=0.0):
@@ -2645,7 +3326,7 @@ class NB(Classifier):
         self._classes    = {}     # {class: frequency}
         self._features   = {}     # {feature: frequency}
         self._likelihood = {}     # {class: {feature: frequency}}
-        self._cache      = {}     # Cache log likelihood sums.
+        self._compiled   = None   # Log-probability matrix (see NB.finalize()).
         self._method     = method # MULTINOMIAL or BERNOUILLI.
         self._alpha      = alpha  # Smoothing.
         Classifier.__init__(self, train, baseline)
@@ -2658,6 +3339,12 @@ class NB(Classifier):
     def features(self):
         return list(self._features.keys())
 
+    def __getstate__(self):
+        # The log-probability matrix is compiled again when needed.
+        state = self.__dict__.copy()
+        state["_compiled"] = None
+        return state
+
     def train(self, document, type=None):
         """ Trains the classifier with the given document of the given type (i.e., class).
             A document can be a Document, Vector, dict, list or string.
@@ -2669,7 +3356,7 @@ class NB(Classifier):
         type, vector = self._vector(document, type=type)
         self._classes[type] = self._classes.get(type, 0) + 1
         self._likelihood.setdefault(type, {})
-        self._cache.pop(type, None)
+        self._compiled = None
         for f, w in vector.items():
             if self._method in (BINARY, BINOMIAL, BERNOUILLI):
                 w = 1
@@ -2681,32 +3368,63 @@ class NB(Classifier):
             If the classifier has been trained on LSA concept vectors
             you need to supply LSA.transform(document).
         """
+        return self.classify_many([document], discrete)[0]
+
+    def classify_many(self, documents=[], discrete=True):
+        """ Returns a list of types (or dicts of (class, probability)-items if discrete=False)
+            for the given list of documents, in the same order.
+        """
         # Given red & round, what is the likelihood that it is an apple?
         # p = p(red|apple) * p(round|apple) * p(apple) / (p(red) * p(round))
         # The multiplication can cause underflow so we use log() instead.
         # For unknown features, we smoothen with an alpha value.
-        v = self._vector(document)[1]
-        m = self._method
-        a = self._alpha
-        n = self._classes.values()
-        n = float(sum(n))
-        p = defaultdict(float)
-        for type in self._classes:
-            if m == MULTINOMIAL:
-                if type not in self._cache: # 10x faster
-                    self._cache[type] = float(sum(self._likelihood[type].values()))
-                d = self._cache[type]
-            if m == BINOMIAL \
-            or m == BERNOUILLI:
-                d = float(self._classes[type])
-            L = self._likelihood[type]
-            g = sum(log((L[f] if f in L else a) / d) for f in v)
-            g = exp(g) * self._classes[type] / n # prior
-            p[type] = g
+        # The sum of log-probabilities of the features in each document for each class
+        # is the product of a binary document x feature matrix and a feature x class matrix.
+        V = [self._vector(document)[1] for document in documents]
+        if not self._classes:
+            return [self._vote({}, discrete) for v in V]
+        c = getattr(self, "_compiled", None) or self.finalize()
+        X = sparse_matrix(V, c["columns"])
+        X.data[:] = 1
+        u = np.array([sum(1 for f in v if f not in c["columns"]) for v in V])
+        g = X.dot(c["likelihood"]) + np.outer(u, c["unknown"]) + c["prior"]
         # Normalize probability estimates.
-        s = sum(p.values()) or 1
-        for type in p:
-            p[type] /= s
+        # The highest log-probability is subtracted first, so that long documents do not underflow.
+        g = np.exp(g - g.max(axis=1)[:, None])
+        g = g / g.sum(axis=1)[:, None]
+        return [self._vote(dict(zip(c["classes"], p)), discrete) for p in g.tolist()]
+
+    def finalize(self):
+        """ Compiles the trained likelihood of each feature in each class to a NumPy array.
+            The array is compiled again after NB.train().
+        """
+        a = self._alpha
+        n = float(sum(self._classes.values()))
+        classes = list(self._classes)
+        columns = dict((f, j) for j, f in enumerate(self._features))
+        # MULTINOMIAL: p(feature|class) = feature frequency / sum of feature frequencies in class.
+        # BERNOUILLI: p(feature|class) = feature frequency / class frequency.
+        if self._method == MULTINOMIAL:
+            d = np.array([float(sum(self._likelihood[type].values())) for type in classes])
+        else:
+            d = np.array([float(self._classes[type]) for type in classes])
+        L = np.zeros((len(columns), len(classes)))
+        L[:] = np.log(a / d)
+        for i, type in enumerate(classes):
+            for f, w in self._likelihood[type].items():
+                L[columns[f], i] = log(w / d[i])
+        self._compiled = {
+             "classes": classes,
+             "columns": columns,
+          "likelihood": L,             # Feature x class log-probabilities.
+             "unknown": np.log(a / d), # Log-probability of an unknown feature in each class.
+               "prior": np.log(np.array([self._classes[type] for type in classes]) / n)
+        }
+        return self._compiled
+
+    def _vote(self, p, discrete=True):
+        """ Returns the type with the highest probability in the given dict of (class, probability)-items.
+        """
         if not discrete:
             return Probabilities(self, p)
         try:
@@ -2733,27 +3451,132 @@ class KNN(Classifier):
         """
         self.k = k               # Number of nearest neighbors to observe.
         self.distance = distance # COSINE, EUCLIDEAN, ...
+        self._index = None       # Sparse matrix of training vectors (see KNN._build()).
         Classifier.__init__(self, train, baseline)
 
+    def __getstate__(self):
+        # The index is rebuilt when needed.
+        state = self.__dict__.copy()
+        state["_index"] = None
+        return state
+
     def train(self, document, type=None):
         """ Trains the classifier with the given document of the given type (i.e., class).
             A document can be a Document, Vector, dict, list or string.
             If no type is given, Document.type will be used instead.
         """
         Classifier.train(self, document, type)
+        self._index = None
 
     def classify(self, document, discrete=True):
         """ Returns the type with the highest probability for the given document.
             If the classifier has been trained on LSA concept vectors
             you need to supply LSA.transform(document).
         """
+        return self.classify_many([document], discrete)[0]
+
+    def classify_many(self, documents=[], discrete=True):
+        """ Returns a list of types (or dicts of (class, probability)-items if discrete=False)
+            for the given list of documents, in the same order.
+        """
+        V = [self._vector(document)[1] for document in documents]
+        return [self._vote(D, discrete) for D in self._neighbors(V)]
+
+    def _build(self):
+        """ Returns a dict with the training vectors as a sparse matrix X,
+            and the transposed matrix (i.e., an inverted index of features => vectors).
+        """
+        a = list(features(v for type, v in self._vectors))
+        X = sparse_matrix([v for type, v in self._vectors], a)
+        self._index = {
+             "columns": dict((f, j) for j, f in enumerate(a)),
+                   "X": X,
+                  "XT": X.T.tocsr(),
+              "norms2": np.asarray(X.multiply(X).sum(axis=1)).ravel(), # Squared L2-norm.
+                  "l1": np.asarray(abs(X).sum(axis=1)).ravel(),
+              "length": np.array([len(v) for type, v in self._vectors])
+        }
+        return self._index
+
+    def _neighbors(self, vectors=[], batch=1000):
+        """ Returns an iterator of lists of k nearest (distance, type)-tuples for the given vectors.
+        """
         # Distance is calculated between the document vector and all training instances.
-        # This will make KNN slow in higher dimensions.
-        classes = {}
-        v1 = self._vector(document)[1]
-        D = ((distance(v1, v2, method=self.distance), type) for type, v2 in self._vectors)
+        # With a built-in distance metric, distances are calculated for all training instances
+        # at once on a sparse matrix, and only the nearest are recalculated with distance(),
+        # so that the results are identical to comparing each instance.
+        # For COSINE, only instances that share features with the document are compared,
+        # by adding up the weights in the inverted index for the document features.
+        if self.distance not in (COSINE, EUCLIDEAN, MANHATTAN, CHEBYSHEV, HAMMING) or not self._vectors:
+            for v1 in vectors:
+                D = ((distance(v1, v2, method=self.distance), type) for type, v2 in self._vectors)
+                D = ((d, type) for d, type in D if d < 1) # Nothing in common if distance=1.0.
+                D = heapq.nsmallest(self.k, D)            # k-least distant.
+                yield D
+            return
+        index = getattr(self, "_index", None) or self._build()
+        for i in range(0, len(vectors), batch):
+            V = vectors[i:i + batch]
+            if self.distance == COSINE:
+                S = sparse_matrix(V, index["columns"]).dot(index["XT"]).tocsr()
+            for j, v1 in enumerate(V):
+                if self.distance == COSINE:
+                    r = slice(S.indptr[j], S.indptr[j + 1])
+                    n = l2_norm(v1) * np.sqrt(index["norms2"][S.indices[r]])
+                    d = 1 - S.data[r] / np.where(n == 0, 1, n)
+                    d = (S.indices[r], d)
+                else:
+                    d = self._distances(v1, index)
+                    d = (np.arange(len(d)), d)
+                yield self._nearest(v1, *d)
+
+    def _distances(self, v1, index):
+        """ Returns a NumPy array with the distance between the given vector
+            and each training vector (EUCLIDEAN, MANHATTAN, CHEBYSHEV or HAMMING).
+        """
+        X = index["X"]
+        c = index["columns"]
+        q = [(c[f], w) for f, w in v1.items() if f in c]
+        u = [abs(w) for f, w in v1.items() if f not in c] # Features not in the training data.
+        j = [j for j, w in q]
+        q = np.array([w for j, w in q], dtype=float)
+        x = X[:, j].toarray()
+        if self.distance == EUCLIDEAN:
+            return np.maximum(index["norms2"] - 2 * x.dot(q) + sum(w * w for w in v1.values()), 0)
+        if self.distance == MANHATTAN:
+            return index["l1"] + (abs(x - q) - abs(x)).sum(axis=1) + sum(u)
+        if self.distance == CHEBYSHEV:
+            m = np.ones(X.shape[1])
+            m[j] = 0
+            d = abs(X).multiply(m).max(axis=1)
+            d = np.asarray(d.toarray() if hasattr(d, "toarray") else d).ravel()
+            d = np.maximum(d, abs(x - q).max(axis=1) if j else 0)
+            return np.maximum(d, max(u or [0]))
+        if self.distance == HAMMING:
+            p = X[:, j]
+            p.data[:] = 1 # Features in both vectors (also with weight 0).
+            p = p.toarray()
+            n = len(v1) + index["length"] - p.sum(axis=1)
+            n = n - ((x == q) * p).sum(axis=1)
+            return n / np.maximum(np.maximum(len(v1), index["length"]), 1)
+
+    def _nearest(self, v1, i, d):
+        """ Returns a list of k nearest (distance, type)-tuples for the given vector,
+            given the indices of candidate training vectors and their approximate distance.
+        """
+        e = 1e-9
+        i, d = i[d < 1 + e], d[d < 1 + e]
+        if len(d) > self.k > 0:
+            t = np.partition(d, self.k - 1)[self.k - 1]
+            i = i[d <= t + e * max(abs(t), 1)]
+        D = ((distance(v1, self._vectors[i][1], method=self.distance), self._vectors[i][0]) for i in i)
         D = ((d, type) for d, type in D if d < 1) # Nothing in common if distance=1.0.
         D = heapq.nsmallest(self.k, D)            # k-least distant.
+        return D
+
+    def _vote(self, D, discrete=True):
+        """ Returns the type with the highest probability for the given (distance, type)-tuples.
+        """
         # Normalize probability estimates.
         s = sum(1 - d for d, type in D) or 1
         p = defaultdict(float)
@@ -86,6 +86,7 @@ setup(
         "pattern"                 : ["*.js"],
         "pattern.web.cache"       : ["tmp/*"],
         "pattern.web.locale"      : ["*"],
+        "pattern.text"            : ["*.txt"],
         "pattern.text.de"         : ["*.txt", "*.xml"],
         "pattern.text.en"         : ["*.txt", "*.xml", "*.slp"],
         "pattern.text.en.wordlist": ["*.txt"],
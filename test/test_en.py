@@ -251,6 +251,16 @@ class TestQuantification(unittest.TestCase):
             self.assertAlmostEqual(x, y, places=10)
         print("pattern.en.number()")
 
+    def test_numbers_many(self):
+        # Assert numeric strings = numbers, for repeated (cached) strings.
+        from pattern.text.en.inflect_quantify import _number_cache
+        n = _number_cache.hits
+        v = en.numbers_many(["twenty five", "three thousand and one", "twenty five", "minus 2.5"])
+        self.assertEqual(v, [25, 3001, 25, -2.5])
+        self.assertTrue(_number_cache.hits > n)
+        self.assertEqual(en.numbers_many([]), [])
+        print("pattern.en.numbers_many()")
+
     def test_quantify(self):
         # Assert quantification algorithm.
         for a, s in (
@@ -604,6 +614,20 @@ class TestParser(unittest.TestCase):
         self.assertEqual(v2, [("The", "cat"), ("cat", "purrs"), ("purrs", "The"), ("The", "dog"), ("dog", "barks")])
         print("pattern.en.ngrams()")
 
+    def test_iter_ngrams(self):
+        # Assert n-grams from an iterable of lines (e.g., a file).
+        s = ["The cat purrs.", "The cat purrs. The dog barks."]
+        v1 = list(en.iter_ngrams(iter(s), n=2))
+        v2 = en.count_ngrams(iter(s), n=2, continuous=True)
+        self.assertEqual(v1, en.ngrams(" ".join(s), n=2))
+        self.assertEqual(v2[("The", "cat")], 2)
+        self.assertEqual(v2[("purrs", "The")], 2)
+        self.assertEqual(sum(v2.values()), 8)
+        # Assert Word.string for parsed input.
+        v3 = en.count_ngrams(en.Text(en.parse(s[1])), n=1)
+        self.assertEqual(v3, {("The",): 2, ("cat",): 1, ("purrs",): 1, ("dog",): 1, ("barks",): 1})
+        print("pattern.en.iter_ngrams()")
+
     def test_command_line(self):
         # Assert parsed output from the command-line (example from the documentation).
         p = ["python", "-m", "pattern.en", "-s", "Nice cat.", "-OTCRL"]
@@ -879,6 +903,13 @@ class TestModality(unittest.TestCase):
         self.assertTrue(v < 0)
         v = en.modality(en.Sentence(en.parse("It will surely stop raining soon.")))
         self.assertTrue(v > 0)
+        # Assert that changes to the lexicon are picked up.
+        from pattern.text.en.modality import epistemic_VB
+        s = en.Sentence(en.parse("It will surely stop raining soon.", lemmata=True))
+        epistemic_VB[-1.00]["rain"] = True
+        self.assertTrue(en.modality(s) < v)
+        del epistemic_VB[-1.00]["rain"]
+        self.assertEqual(en.modality(s), v)
         # Assert the accuracy of the modality algorithm.
         # Given are the scores for the CoNLL-2010 Shared Task 1 Wikipedia uncertainty data:
         # http://www.inf.u-szeged.hu/rgai/conll2010st/tasks.html#task1
@@ -898,6 +929,20 @@ class TestModality(unittest.TestCase):
         self.assertTrue(F > 0.68)
         print("pattern.en.modality()")
 
+    def test_analyze(self):
+        # Assert (mood, modality) for each sentence in a Text.
+        t = en.Text(en.parse("Do your homework! I wish I knew.", lemmata=True))
+        v = list(en.analyze_many(t))
+        self.assertEqual(v[0], (en.mood(t[0]), en.modality(t[0])))
+        self.assertEqual(v[1], (en.mood(t[1]), en.modality(t[1])))
+        self.assertEqual(v[0][0], en.IMPERATIVE)
+        self.assertEqual(v[1][0], en.SUBJUNCTIVE)
+        self.assertTrue(v[1][1] < 0.5)
+        # Assert string input.
+        self.assertEqual(list(en.analyze_many("Do your homework!")), v[:1])
+        self.assertRaises(TypeError, en.analyze, "Do your homework!")
+        print("pattern.en.analyze()")
+
 #---------------------------------------------------------------------------------------------------
 
 
@@ -1033,6 +1078,20 @@ class TestWordNet(unittest.TestCase):
     def test_version(self):
         print("WordNet " + en.wordnet.VERSION)
 
+    def test_load(self):
+        # Assert that NLTK and the WordNet corpus are loaded on first use.
+        # Each assertion runs in a new process (another test may have loaded WordNet already).
+        import subprocess
+        def run(s):
+            s = "import sys; from pattern.en import wordnet; %s; print('nltk' in sys.modules, 'wordnet' in wordnet._loaded)" % s
+            s = subprocess.check_output([sys.executable, "-c", s], cwd=os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+            return s.decode("utf-8").split()[-2:]
+        self.assertEqual(run("import pattern.en"), ["False", "False"])
+        self.assertEqual(run("wordnet.NOUN"), ["False", "False"])
+        self.assertEqual(run("wordnet.VERSION"), ["True", "True"])
+        self.assertEqual(run("wordnet.preload(ic=False, sentiwordnet=False)"), ["True", "True"])
+        print("pattern.en.wordnet.load()")
+
     def test_synsets(self):
         # Assert synsets by part-of-speech.
         for word, pos in (
@@ -1078,6 +1137,18 @@ class TestWordNet(unittest.TestCase):
         self.assertTrue(en.wordnet.ancestor(v1, v2) == en.wordnet.synsets("carnivore")[0])
         print("pattern.en.wordnet.ancestor()")
 
+    def test_similarity_matrix(self):
+        # Assert Lin-similarity matrix (same as Synset.similarity()).
+        s = en.wordnet.synsets
+        m = en.wordnet.similarity_matrix(["tree", "cat"], ["flower", "dog", "xyzzy"])
+        self.assertAlmostEqual(m[0][0], s("tree")[0].similarity(s("flower")[0]), places=10)
+        self.assertAlmostEqual(m[1][1], s("cat")[0].similarity(s("dog")[0]), places=10)
+        self.assertTrue(m[0][0] > m[0][1])
+        self.assertEqual(m[0][2], 0.0)
+        # Assert Synset objects are cached.
+        self.assertTrue(s("cat")[0] is s("cat")[0])
+        print("pattern.en.wordnet.similarity_matrix()")
+
     def test_map32(self):
         # Assert sense mapping from WN 3.0 to 2.1.
         self.assertEqual(en.wordnet.map32(18850, "JJ"), (19556, "JJ"))
@@ -12,6 +12,7 @@ import os
 import sys
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
 import unittest
+import json
 try:
     # Python 2
     from StringIO import StringIO
@@ -39,6 +40,12 @@ class TestLexicon(unittest.TestCase):
         self.assertTrue(dict.__contains__(v, "a") is False)
         self.assertTrue(len(v), 1)
         self.assertTrue(v["a"] == 1)
+        # Assert lazy dictionary is pickled with its data.
+        import pickle
+        v = text.Lexicon(path="cat NN\ncats NNS")
+        v.load()
+        v = pickle.loads(pickle.dumps(v))
+        self.assertEqual(dict(dict.items(v)), {"cat": "NN", "cats": "NNS"})
         print("pattern.text.lazydict")
 
     def test_lazylist(self):
@@ -63,6 +70,42 @@ class TestLexicon(unittest.TestCase):
         self.assertEqual(v2["schrödinger"], "NNP")
         print("pattern.text.Lexicon")
 
+    def test_resources(self):
+        # Assert resources with the same path share data, interned strings and stats.
+        import tempfile
+        f = os.path.join(tempfile.mkdtemp(), "xx-lexicon.txt")
+        open(f, "w").write("cat NN\ncats NNS\nthe DT")
+        v1 = text.Lexicon(path=f)
+        v2 = text.Lexicon(path=f)
+        self.assertEqual(v1, v2)
+        self.assertTrue(v1["cat"] is v2["cat"])
+        self.assertTrue(v1["cat"] is text.resources.intern("NN"))
+        self.assertEqual(text.resources.stats[f]["type"], "Lexicon")
+        self.assertEqual(text.resources.stats[f]["items"], 3)
+        self.assertTrue(text.resources.stats[f]["memory"] > 0)
+        # Assert that changes to a resource are not shared.
+        v1["dog"] = "NN"
+        self.assertTrue("dog" not in text.Lexicon(path=f))
+        self.assertTrue("dog" not in text.Lexicon(path=f))
+        self.assertTrue("dog" not in v2)
+        # Assert that changes to the file are loaded.
+        open(f, "w").write("cat NN\ncats NNS\nthe DT\ndog NN")
+        os.utime(f, (os.path.getmtime(f) + 10, os.path.getmtime(f) + 10))
+        self.assertEqual(len(text.Lexicon(path=f)), 4)
+        # Assert resources loaded from a bundle.
+        # Files are only read from the bundle if they are in pattern.text.
+        p = os.path.join(text.MODULE, "en", "en-lexicon.txt")
+        text.resources.bundle(f + ".bundle", [p])
+        self.assertRaises(ValueError, text.resources.bundle, f + ".bundle", [f])
+        text.resources.open(f + ".bundle")
+        self.assertEqual(text.resources.lines(p), open(p, encoding="utf-8").read().splitlines())
+        self.assertEqual(text.resources.lines(os.path.join(os.path.dirname(f), "en-lexicon.txt")), None)
+        self.assertEqual(text.resources.lines(f), None)
+        self.assertEqual(text.Lexicon(path=f)["dog"], "NN")
+        text.resources.close()
+        os.remove(f + ".bundle")
+        print("pattern.text.Resources")
+
 #---------------------------------------------------------------------------------------------------
 
 
@@ -102,6 +145,33 @@ class TestModel(unittest.TestCase):
         self.assertEqual(["white", "JJ"], v.apply(("white", ""), next=("cat", "")))
         print("pattern.text.Model")
 
+    def test_train_many(self):
+        # Assert SLP language model trained on a corpus, resumed from a checkpoint.
+        import tempfile
+        f = os.path.join(tempfile.mkdtemp(), "model.slp")
+        s = [[("the", "DT"), ("black", "JJ"), ("cat", "NN")], "the/DT cat/NN sat/VBD on/IN the/DT mat/NN"] * 10
+        def stop(stats):
+            raise KeyboardInterrupt
+        self.assertRaises(KeyboardInterrupt, text.Model().train_many, s, 2, checkpoint=f, every=5, callback=stop)
+        self.assertTrue(os.path.exists(f + ".shards"))
+        v = text.Model().train_many(s, 2, checkpoint=f, every=5)
+        self.assertEqual(v["iteration"], 2)
+        self.assertEqual(v["sentences"], 35)
+        self.assertTrue(v["speed"] > 0)
+        self.assertFalse(os.path.exists(f + ".shards"))
+        self.assertEqual("JJ", text.Model(path=f).classify("black", previous=("the", "DT"), next=("cat", "NN")))
+        # Assert that the corpus is not sharded for one iteration.
+        os.remove(f)
+        self.assertRaises(KeyboardInterrupt, text.Model().train_many, s, 1, checkpoint=f, every=5, callback=stop)
+        self.assertFalse(os.path.exists(f + ".shards"))
+        # Assert that the shards of another corpus are not reused.
+        d = tempfile.mkdtemp()
+        a = text._shard(s, d, 2)
+        self.assertEqual(text._shard(s, d, 2), a)
+        self.assertEqual(sum(len(open(x).readlines()) for x in text._shard(s[:3], d, 2)), 3)
+        self.assertEqual(sum(len(open(x).readlines()) for x in text._shard(iter(s), d, 2)), 20)
+        print("pattern.text.Model.train_many()")
+
 #---------------------------------------------------------------------------------------------------
 
 
@@ -153,6 +223,24 @@ class TestEntities(unittest.TestCase):
             [["Schrödinger's", "NNP-PERS"], ["cat", "NNP-PERS"]])
         print("pattern.text.Entities")
 
+    def test_longest_match(self):
+        # Assert the longest named entity is matched, also after Entities.append().
+        v = text.Entities(path=StringIO("New LOC\nNew York LOC"))
+        v.append("New York Times", "ORG")
+        v.extend([("Hooloovoo", "PERS")])
+        self.assertEqual(v.apply(
+            [["new", "JJ"], ["york", "NN"], ["times", "NNS"], ["and", "CC"], ["new", "JJ"], ["york", "NN"],
+             ["hooloovoo", "NN"], ["bob@example.com", "NN"]]),
+            [["new", "NNP-ORG"], ["york", "NNP-ORG"], ["times", "NNP-ORG"], ["and", "CC"],
+             ["new", "NNP-LOC"], ["york", "NNP-LOC"], ["hooloovoo", "NNP-PERS"], ["bob@example.com", "NNP"]])
+        # Assert that replacing an entry updates the named entities.
+        v["new"] = [["new", "jersey", "loc"]]
+        self.assertEqual(v.apply([["new", "JJ"], ["york", "NN"], ["new", "JJ"], ["jersey", "NN"]]),
+            [["new", "JJ"], ["york", "NN"], ["new", "NNP-LOC"], ["jersey", "NNP-LOC"]])
+        del v["new"]
+        self.assertEqual(v.apply([["new", "JJ"], ["jersey", "NN"]]), [["new", "JJ"], ["jersey", "NN"]])
+        print("pattern.text.Entities.apply()")
+
 #---------------------------------------------------------------------------------------------------
 
 
@@ -186,6 +274,20 @@ class TestParser(unittest.TestCase):
         self.assertEqual(v4, ["dog", "cat"])
         print("pattern.text.Parser.find_keywords()")
 
+    def test_find_keywords_many(self):
+        # Assert batch keyword extraction (same as find_keywords()).
+        p = text.Parser()
+        p.lexicon["cat"] = "NN"
+        p.lexicon["dog"] = "NN"
+        f = {"cat": 1.0, "dog": 0.0}
+        v = ["cat. cat. dog.", ("x", "cat. dog. dog."), ""]
+        self.assertEqual(list(p.find_keywords_many(v, frequency=f)), [
+            (0, p.find_keywords("cat. cat. dog.", frequency=f)),
+            ("x", p.find_keywords("cat. dog. dog.", frequency=f)),
+            (2, [])])
+        self.assertEqual(list(p.find_keywords_many(v, frequency=f, workers=2)), list(p.find_keywords_many(v, frequency=f)))
+        print("pattern.text.Parser.find_keywords_many()")
+
     def test_find_tokens(self):
         # Assert the default tokenizer and its optional parameters.
         p = text.Parser()
@@ -227,6 +329,36 @@ class TestParser(unittest.TestCase):
         self.assertEqual(v4, [["", "DT", "B-NP", "O"], ["", "NN", "I-NP", "O"], ["", "JJ", "I-NP", "O"]])
         print("pattern.text.Parser.find_chunks()")
 
+    def test_serve(self):
+        # Assert newline-delimited JSON requests and responses.
+        p = text.Parser(lexicon={"the": "DT", "cat": "NN"})
+        i = StringIO('{"id": 1, "text": "the cat", "chunks": false}\n\n"the cat"\n{"id": 2}\n')
+        o = StringIO()
+        text.serve(p.parse, stdin=i, stdout=o)
+        o = [json.loads(r) for r in o.getvalue().splitlines()]
+        self.assertEqual(o[0], {"id": 1, "result": "the/DT cat/NN"})
+        self.assertEqual(o[1], {"id": None, "result": "the/DT/B-NP/O cat/NN/I-NP/O"})
+        self.assertEqual(o[2]["id"], 2)
+        self.assertTrue("error" in o[2])
+        # Assert that a file at the socket path is not removed.
+        import tempfile
+        f = os.path.join(tempfile.mkdtemp(), "parser.sock")
+        open(f, "w").close()
+        self.assertRaises(ValueError, text.serve, p.parse, path=f)
+        self.assertTrue(os.path.exists(f))
+        os.remove(f)
+        print("pattern.text.serve()")
+
+    def test_model(self):
+        # Assert the language model is loaded on first use.
+        m = os.path.join(os.path.dirname(text.__file__), "en", "en-model.slp")
+        p = text.Parser(lexicon={"the": "DT"}, model=m)
+        self.assertEqual(p._model, m)
+        self.assertEqual(p.find_tags(["the", "cats"])[1][1], "NNS")
+        self.assertTrue(isinstance(p._model, text.Model))
+        self.assertTrue(text.Parser(model=m).warmup()._model.path == m)
+        print("pattern.text.Parser.model")
+
 #---------------------------------------------------------------------------------------------------
 
 
@@ -263,6 +395,99 @@ class TestSentiment(unittest.TestCase):
         self.assertEqual(s(v)[0], +0.9)
         self.assertEqual(s(v)[1], +0.9)
 
+    def test_ngrams(self):
+        # Assert longest multiword match.
+        s = text.Sentiment()
+        s.annotate("hit", polarity=-0.5)
+        s.annotate("hit the spot", polarity=+1.0)
+        s.annotate("the spot", polarity=+0.5)
+        v = "hit the spot"
+        self.assertEqual(s(v).assessments, [(["hit the spot"], +1.0, 0.0, None)])
+        self.assertEqual(s(v, ngrams=2).assessments, [(["hit"], -0.5, 0.0, None), (["the spot"], +0.5, 0.0, None)])
+        self.assertEqual(s(v, ngrams=1).assessments, [(["hit"], -0.5, 0.0, None)])
+        # Assert that the multiword entries are updated when the lexicon changes (same size).
+        s["hit the mark"] = s.pop("hit the spot")
+        self.assertEqual(s("hit the mark").assessments, [(["hit the mark"], +1.0, 0.0, None)])
+        self.assertEqual(s(v).assessments, [(["hit"], -0.5, 0.0, None), (["the spot"], +0.5, 0.0, None)])
+        print("pattern.text.Sentiment.assessments(ngrams=3)")
+
+    def test_score_many(self):
+        # Assert batch scores equal Sentiment.__call__() (with modifiers, negation, emoticons).
+        s = text.Sentiment()
+        s.annotate("good", "JJ", polarity=+0.7, subjectivity=0.6)
+        s.annotate("bad", "JJ", polarity=-0.7, subjectivity=0.7)
+        s.annotate("very", "RB", polarity=+0.2, subjectivity=0.3, intensity=1.3)
+        v = [
+            "good",
+            "very good",
+            "not very good",
+            "not a bad movie :-)",
+            "very , very bad !",
+            "really not good",
+            "",
+            "nothing"
+        ]
+        a, b = s.score_many(v, assessments=True)
+        for i, x in enumerate(v):
+            self.assertAlmostEqual(a[i][0], s(x)[0])
+            self.assertAlmostEqual(a[i][1], s(x)[1])
+            self.assertEqual(b[i], s(x).assessments)
+        self.assertEqual(a.shape, (len(v), 2))
+        print("pattern.text.Sentiment.score_many()")
+
+    def test_cache(self):
+        # Assert the compiled lexicon yields the same scores as the XML-file.
+        import tempfile
+        f = os.path.join(os.path.dirname(__file__), "..", "pattern", "text", "xx", "xx-sentiment.xml")
+        s1 = text.Sentiment(f, cache=None)
+        s2 = text.Sentiment(f, cache=tempfile.mkdtemp())
+        s3 = text.Sentiment(f, cache=s2.cache)
+        s1.load()
+        s2.load()
+        s3.load()
+        self.assertTrue(len(os.listdir(s2.cache)) == 1)
+        self.assertTrue(os.listdir(s2.cache)[0].endswith(".json"))
+        self.assertEqual(dict(s1), dict(s3))
+        self.assertEqual(s1.labeler, s3.labeler)
+        self.assertEqual(s1._synsets, s3._synsets)
+        # Assert that the cache is off by default.
+        self.assertEqual(text.Sentiment(f).cache, None)
+        # Assert that the cache folder is created for the current user only.
+        s4 = text.Sentiment(f, cache=os.path.join(tempfile.mkdtemp(), "cache"))
+        s4.load()
+        self.assertEqual(os.stat(s4.cache).st_mode & 0o077, 0)
+        self.assertEqual(dict(s1), dict(s4))
+        # Assert that a cache folder that other users can write to is not used.
+        s5 = text.Sentiment(f, cache=tempfile.mkdtemp())
+        os.chmod(s5.cache, 0o777)
+        s5.load()
+        self.assertEqual(os.listdir(s5.cache), [])
+        self.assertEqual(dict(s1), dict(s5))
+        print("pattern.text.Sentiment.cache")
+
+#---------------------------------------------------------------------------------------------------
+
+
+class TestSpelling(unittest.TestCase):
+
+    def setUp(self):
+        pass
+
+    def test_suggest_many(self):
+        # Assert batch spelling correction with cached suggestions.
+        v = text.Spelling(path="cat 10 \n car 5 \n cart 1")
+        w = ["cst", "Cat", "cst", "carr"]
+        for workers, processes in ((1, False), (2, False), (2, True)):
+            v.cache.clear()
+            self.assertEqual(v.suggest_many(w, workers=workers, processes=processes), [v.suggest(x) for x in w])
+        self.assertEqual(v.cache.hits, 0)
+        self.assertEqual(v.cache.misses, 3)
+        v.suggest_many(w)
+        self.assertEqual(v.cache.hits, 3)
+        self.assertEqual(v.stats["hit_rate"], 0.5)
+        self.assertTrue(v.stats["latency"][50] > 0)
+        print("pattern.text.Spelling.suggest_many()")
+
 #---------------------------------------------------------------------------------------------------
 
 
@@ -278,6 +503,14 @@ class TestMultilingual(unittest.TestCase):
         self.assertEqual(text.language("le chat s'était assis sur le tapis")[0], "fr")
         print("pattern.text.language()")
 
+    def test_language_many(self):
+        # Assert batch language recognition (same as language()).
+        v = ["the cat sat on the mat", "кошка сидела на коврике", "el gato se sentó en la alfombra", ""]
+        self.assertEqual([x[0] for x in text.language_many(v)], ["en", "ru", "es", "en"])
+        for x1, x2 in zip(text.language_many(v), [text.language(s) for s in v]):
+            self.assertAlmostEqual(x1[1], x2[1], places=5)
+        print("pattern.text.language_many()")
+
     def test_deflood(self):
         # Assert flooding removal.
         self.assertEqual(text.deflood("NIIICE!!!", n=1), "NICE!")
@@ -297,6 +530,7 @@ def suite():
     suite.addTest(unittest.TestLoader().loadTestsFromTestCase(TestEntities))
     suite.addTest(unittest.TestLoader().loadTestsFromTestCase(TestParser))
     suite.addTest(unittest.TestLoader().loadTestsFromTestCase(TestSentiment))
+    suite.addTest(unittest.TestLoader().loadTestsFromTestCase(TestSpelling))
     suite.addTest(unittest.TestLoader().loadTestsFromTestCase(TestMultilingual))
     return suite
 